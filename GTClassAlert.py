@@ -3,15 +3,29 @@
 import logging
 import os
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
 from datetime import datetime
 
 import telebot
 
+from modules import broadcast
+from modules import calendar_feed
+from modules import conversation
+from modules import delivery
 from modules import lesson_controller
+from modules import lesson_search
+from modules import logs
+from modules import metrics
+from modules import migrations
 from modules import user_controller
 from modules import reminder
+from modules import replies
+from modules import sharding
+from modules import timetable_photos
+from modules import timetable_render
+from modules import webhook
 from modules.admin_module import register_admin_commands
+from modules.lesson import format_time
 from settings.token import token  # private bot token
 from settings import config
 from settings import strings
@@ -19,31 +33,41 @@ from settings import strings
 """
 Main GTUCClassAlert source
 All user interaction through telegram is written here
+Importing this module only declares the bot and its handlers, everything is started by main()
 """
 
-# log configuration
 logger = logging.getLogger(config.LOGGER_NAME)
-logger.setLevel(logging.INFO)
-handler = RotatingFileHandler(config.LOG_FILE_NAME, maxBytes=config.LOG_MAX_SIZE_BYTES, backupCount=1)
-handler.setFormatter(logging.Formatter("%(asctime)s :: %(message)s", "%d.%m.%Y :: %H:%M:%S"))
-logger.addHandler(handler)
 
+if config.BOT_API_URL:
+    telebot.apihelper.API_URL = config.BOT_API_URL
 bot = telebot.TeleBot(token)
 
+
+@bot.message_handler(func=lambda message: conversation.get_step(message.chat.id) is not None)
+def conversation_step_handler(message):
+    """
+    Messages of chats in the middle of a dialog (e.g. /configure) are answers to the last question.
+    This handler is registered first, so it takes precedence over all other handlers
+    """
+    step_handlers[conversation.get_step(message.chat.id)](message)
+
+
 # register admin command handlers for sending messages everyone, e.t.c.
 register_admin_commands(bot)
 
 # main three buttons are declared here
 main_markup = telebot.types.ReplyKeyboardMarkup(True)
 main_markup.add(strings.TEXT_BUTTON_NOW, strings.TEXT_BUTTON_DAY, strings.TEXT_BUTTON_WEEK)
+# {button text: minutes} of lead times users choose for reminders
+remind_lead_buttons = {strings.TEXT_REMIND_LEAD.format(minutes): minutes for minutes in config.REMIND_LEAD_OPTIONS}
 
 
-@bot.message_handler(commands=['start', 'help', 'configure', 'reminders', 'friend'])
+@bot.message_handler(commands=['start', 'help', 'configure', 'reminders', 'friend', 'calendar'])
+@logs.logged_handler
 def command_handler(message):
     """
     All commands are processed by this handler
     """
-    log(message)
     # Register user if he is not registered
     if not user_controller.is_registered(message.from_user.id):
         user_controller.register(message.from_user.id, message.from_user.username)
@@ -54,23 +78,25 @@ def command_handler(message):
         options = telebot.types.ReplyKeyboardMarkup(True, False)
         # add buttons to choose course
         options.add(*list(config.REGISTERED_COURSES.keys()))
-        msg = bot.send_message(message.chat.id, strings.REQUEST_COURSE, reply_markup=options)
-        bot.register_next_step_handler(msg, process_course_step)
+        bot.send_message(message.chat.id, strings.REQUEST_COURSE, reply_markup=options)
+        conversation.set_step(message.chat.id, 'course')
     elif message.text == "/help":
         bot.send_message(message.chat.id, strings.MESSAGE_HELP, reply_markup=main_markup)
     elif message.text == '/reminders':
         set_reminders(message)
+    elif message.text == '/calendar':
+        send_calendar_url(message.chat.id, message.from_user.id)
     # elif message.text == '/friend':
     #    msg = bot.send_message(message.chat.id, strings.REQUEST_ALIAS)
     #    bot.register_next_step_handler(msg, process_friend_request_step)
 
 
 @bot.message_handler(regexp=f"^({'|'.join(strings.TEXT_DAYS_OF_WEEK)})⭐?$")
+@logs.logged_handler
 def weekday_select_handler(message):
     """
     Handler for viewing schedule for specific day
     """
-    log(message)
     if not is_user_configured(message):
         return
     # remove star symbol if needed
@@ -78,20 +104,18 @@ def weekday_select_handler(message):
     # force check message is weekday due to bug
     if weekday not in strings.TEXT_DAYS_OF_WEEK:
         return
-    # get list of lessons for specified user and day
-    schedule = lesson_controller.get_day_lessons(message.from_user.id, day=strings.TEXT_DAYS_OF_WEEK.index(weekday))
-    # convert lessons to understandable string output
-    reply = strings.MESSAGE_FREE_DAY if not schedule else \
-        strings.HEADER_SEPARATOR.join(str(lesson) for lesson in schedule)
+    # get rendered schedule for user`s course group and specified day
+    user = user_controller.get(message.from_user.id)
+    reply = replies.get_day_reply(user.course, user.course_group, strings.TEXT_DAYS_OF_WEEK.index(weekday))
     bot.send_message(message.chat.id, reply, reply_markup=main_markup)
 
 
 @bot.message_handler(regexp=f"^({strings.TEXT_BUTTON_NOW}|{strings.TEXT_BUTTON_DAY}|{strings.TEXT_BUTTON_WEEK})$")
+@logs.logged_handler
 def main_buttons_handler(message):
     """
     Handler for processing three main buttons requests
     """
-    log(message)
     if not is_user_configured(message):
         return
     # update alias if it was changed
@@ -113,12 +137,33 @@ def main_buttons_handler(message):
         send_timetable_photo(message.chat.id)
 
 
+@bot.inline_handler(lambda query: True)
+@logs.logged_handler
+def inline_search_handler(query):
+    """
+    Handler for inline queries, searches lessons by subject, teacher and room
+    Lessons of user`s course group go first
+    """
+    user = user_controller.get(query.from_user.id)
+    course, course_group = (user.course, user.course_group) if user else (None, None)
+    results = []
+    for number, (found_course, found_group, day, lesson) in \
+            enumerate(lesson_search.search(query.query, course, course_group)):
+        cohort = f"{found_course} {found_group or strings.TEXT_ALL_GROUPS}"
+        content = telebot.types.InputTextMessageContent(f"{strings.TEXT_WEEKDAYS[day]}, {cohort}\n{lesson.text}")
+        results.append(telebot.types.InlineQueryResultArticle(
+            str(number), f"{lesson.subject} {lesson.type} - {strings.TEXT_WEEKDAYS[day]} {format_time(lesson.start)}",
+            content, description=f"{cohort}, 🚪{lesson.room}, {lesson.teacher}"))
+    # results depend on current time and user`s course group
+    bot.answer_inline_query(query.id, results, cache_time=60, is_personal=True)
+
+
 @bot.message_handler()
+@logs.logged_handler
 def unknown_input_handler(message):
     """
     Handler for any other unknown messages
     """
-    log(message)
     # show main buttons if unknown input sent
     bot.send_message(message.chat.id, strings.MESSAGE_ERROR, reply_markup=main_markup)
 
@@ -136,6 +181,7 @@ def process_course_step(message):
     """
     course = message.text
     if course not in config.REGISTERED_COURSES.keys():
+        conversation.clear(message.chat.id)
         unknown_input_handler(message)
         return
     user_controller.set_course(message.from_user.id, course)
@@ -143,8 +189,8 @@ def process_course_step(message):
     options = telebot.types.ReplyKeyboardMarkup(True, False)
     # add buttons of groups in selected course
     options.add(*list(config.REGISTERED_COURSES[course]))
-    msg = bot.send_message(message.chat.id, strings.REQUEST_GROUP, reply_markup=options)
-    bot.register_next_step_handler(msg, process_group_step)
+    bot.send_message(message.chat.id, strings.REQUEST_GROUP, reply_markup=options)
+    conversation.set_step(message.chat.id, 'group')
 
 
 def process_group_step(message):
@@ -153,6 +199,7 @@ def process_group_step(message):
     """
     course = user_controller.get(message.from_user.id).course
     if message.text not in config.REGISTERED_COURSES[course]:
+        conversation.clear(message.chat.id)
         unknown_input_handler(message)
         return
     user_controller.set_course_group(message.from_user.id, message.text)
@@ -161,14 +208,14 @@ def process_group_step(message):
 
 def set_reminders(message):
     """
-    Ask user to allow send him reminders
+    Ask user to allow send him reminders and how many minutes before lessons
     Function could be called from /reminder command or in configuring process
     """
-    # request user to allow reminders
+    # request user to choose lead time or to disable reminders
     markup = telebot.types.ReplyKeyboardMarkup(True, False)
-    markup.add(strings.MESSAGE_YES, strings.MESSAGE_NO)
-    msg = bot.send_message(message.chat.id, strings.REQUEST_REMINDERS, reply_markup=markup)
-    bot.register_next_step_handler(msg, process_reminders_step)
+    markup.add(*remind_lead_buttons.keys(), strings.MESSAGE_NO)
+    bot.send_message(message.chat.id, strings.REQUEST_REMINDERS, reply_markup=markup)
+    conversation.set_step(message.chat.id, 'reminders')
 
 
 def process_reminders_step(message):
@@ -176,7 +223,9 @@ def process_reminders_step(message):
     Save user`s reminder choice to database
     """
     user_id = message.from_user.id
-    if message.text == strings.MESSAGE_YES:
+    conversation.clear(message.chat.id)
+    if message.text in remind_lead_buttons:
+        user_controller.set_remind_lead(user_id, remind_lead_buttons[message.text])
         user_controller.set_reminders(user_id, True)
     elif message.text == strings.MESSAGE_NO:
         user_controller.set_reminders(user_id, False)
@@ -186,6 +235,12 @@ def process_reminders_step(message):
     bot.send_message(message.chat.id, strings.MESSAGE_SETTINGS_SAVED, reply_markup=main_markup)
 
 
+# functions answering each step of conversation, see conversation_step_handler
+step_handlers = {'course': process_course_step,
+                 'group': process_group_step,
+                 'reminders': process_reminders_step}
+
+
 def send_current_schedule(to_chat_id, about_user_id):
     """
     Send current lessons to user
@@ -194,79 +249,130 @@ def send_current_schedule(to_chat_id, about_user_id):
     :param to_chat_id: int
     :param about_user_id: int
     """
-    current_lesson = lesson_controller.get_current_lesson(about_user_id)
-    next_lesson = lesson_controller.get_next_lesson(about_user_id)
-    # add headers if needed
-    reply = strings.HEADER_NOW + current_lesson.get_str_current() if current_lesson else ""
-    reply += strings.HEADER_NEXT + next_lesson.get_str_future() if next_lesson else strings.HEADER_NO_NEXT_LESSONS
+    user = user_controller.get(about_user_id)
+    reply = replies.get_now_reply(user.course, user.course_group)
     bot.send_message(to_chat_id, reply, reply_markup=main_markup)
 
 
-def log(message):
+@metrics.timed('reminder_tick_seconds')
+def remind_time(at):
     """
-    Write log info about message to file
+    Function is called by reminder module before lessons start
+    Reminders for all users are sent concurrently by delivery module
+
+    :param at: datetime of remind
     """
-    logger.info(f"{message.from_user.username} :-: {message.text if message.text else '--not_text--'}")
+    # get relevant reminders for remind moment
+    messages = [(user_id, strings.HEADER_REMIND + str(lesson))
+                for user_id, lesson in lesson_controller.get_relevant_reminders(at)]
+    delivery.send_all(lambda chat_id, text: bot.send_message(chat_id, text, reply_markup=main_markup), messages)
 
 
-def remind_time():
+def send_calendar_url(to_chat_id, about_user_id):
     """
-    Function is called by reminder module every 10mins to check for new reminders
-    Iterates over users and sends reminders if needed
+    Send url of iCalendar feed of user`s course group
+
+    :param to_chat_id: int
+    :param about_user_id: int
     """
-    # get relevant reminders for current moment
-    for remind in lesson_controller.get_relevant_reminders():
-        user_id, lesson = remind[0], remind[1]
-        try:
-            bot.send_message(user_id, strings.HEADER_REMIND + str(lesson), reply_markup=main_markup)
-        except Exception as exception:
-            # 403 Forbidden means user blocked the bot
-            if hasattr(exception, 'result') and exception.result.status_code == 403:
-                # delete user from database
-                user_controller.delete(user_id)
-            continue
+    if not config.CALENDAR_PORT:
+        bot.send_message(to_chat_id, strings.MESSAGE_CALENDAR_DISABLED, reply_markup=main_markup)
+        return
+    user = user_controller.get(about_user_id)
+    url = calendar_feed.get_url(user.course, user.course_group)
+    bot.send_message(to_chat_id, strings.MESSAGE_CALENDAR.format(url), reply_markup=main_markup)
 
 
 def send_timetable_photo(user_id):
+    """
+    Send weekly timetable image of user`s course group
+    should be called from WEEK button press
+
+    :param user_id: int
+    """
     user = user_controller.get(user_id)
-    with open('url_dump.txt') as f:
-        content = f.readlines()
-    # you may also want to remove whitespace characters like `\n` at the end of each line
-    content = [x.strip() for x in content]
-
-    if user.course == 'Lvl 100':
-        print(100)
-        bot.send_photo(user_id, content[0])
-    elif user.course == 'Lvl 200':
-        bot.send_photo(user_id, content[1])
-    elif user.course == 'Lvl 300':
-        if user.course_group == 'Comp Eng':
-            bot.send_photo(user_id, content[2])
-        else:
-            bot.send_photo(user_id, content[3])
-    else:
-        if user.course_group == 'Comp Eng':
-            bot.send_photo(user_id, content[4])
-        else:
-            bot.send_photo(user_id, content[5])
+    timetable_photos.send_timetable_photo(bot, user_id, user.course, user.course_group)
+
+
+def sync_timetable_photos():
+    """
+    Uploads changed timetable images using cinary.py and starts sending them by new urls
+    """
+    import cinary  # cloudinary is needed only for uploading
 
+    try:
+        cinary.configure()
+        uploaded = cinary.sync_timetables(sorted(set(config.TIMETABLE_PHOTOS.values())))
+    except Exception as exception:
+        logger.exception(f"PHOTOS upload failed: {exception}")
+        return
+    if uploaded:
+        timetable_photos.reload()
+
+
+def start_in_background(function):
+    """
+    Runs function in background thread
+    daemon=True means die if main thread dies
 
-# Tell reminder module which function should be called in remind time
-reminder.notify_need_remind(remind_time)
+    :param function: function
+    """
+    threading.Thread(target=function, daemon=True).start()
 
-# Save step handlers in file and load in case of restart
-bot.enable_save_next_step_handlers()
-bot.load_next_step_handlers()
 
-# execute cinary.py responsible for uploading images
-# to cloudinary using its API
-os.chdir(os.path.join(os.path.dirname(sys.argv[0]), '.'))
-if not os.path.exists('url_dump.txt'):
-    print("url_dump.txt does not exist, uploading to cloudinary")
-    if os.path.exists('cinary.py'):
-        exec(open('cinary.py').read())
+def main():
+    """
+    Starts the bot: prepares database and background jobs, then listens for user`s messages
+    Everything slow (uploads, drawing images) is done in background after bot starts answering
+    """
+    # all files (database, images, logs) are relative to this script
+    os.chdir(os.path.join(os.path.dirname(sys.argv[0]), '.'))
+    logs.configure_logging()
+    if config.METRICS_PORT:
+        metrics.start_server()
+    if config.CALENDAR_PORT:
+        calendar_feed.start_server()
+
+    # bring database schema up to date before any request
+    migrations.migrate()
+    # senders of broadcasts were stopped with the previous process, they could be resumed by admin
+    broadcast.mark_interrupted()
+
+    # Fork update handling processes before any background thread is started
+    dispatcher = None
+    if config.RUN_MODE == 'webhook':
+        webhook.check_config()
+    if config.RUN_MODE == 'webhook' and config.SHARD_WORKERS:
+        dispatcher = sharding.ShardedDispatcher(bot, config.SHARD_WORKERS)
+        dispatcher.start()
+
+    # Tell reminder module which function should be called in remind time
+    reminder.notify_need_remind(remind_time)
+
+    # reload timetable when it is imported by timetable_import
+    start_in_background(lesson_controller.watch_timetable)
+    # inline search index is built before the first query and after every timetable change
+    start_in_background(lesson_search.get_index)
+    lesson_controller.on_timetable_change(lambda: start_in_background(lesson_search.get_index))
+
+    # Forget dialogs abandoned while bot was stopped
+    conversation.expire()
+
+    # upload changed timetable images to cloudinary in background,
+    # until it is finished images are sent from local files
+    start_in_background(sync_timetable_photos)
+    # draw timetable images of all course groups in background, and again after timetable changes
+    if config.RENDER_TIMETABLES:
+        start_in_background(timetable_render.prewarm)
+        lesson_controller.on_timetable_change(lambda: start_in_background(timetable_render.prewarm))
+
+    # start listening for user`s messages
+    if config.RUN_MODE == 'webhook':
+        webhook.run_webhook(bot, dispatcher.dispatch if dispatcher else None)
+    else:
+        # bot.polling(none_stop=True, timeout=50)  # for DEBUG only. Does not restart bot in case of crash
+        bot.infinity_polling(none_stop=True, timeout=50)
 
-# start listening for user`s messages
-# bot.polling(none_stop=True, timeout=50)  # for DEBUG only. Does not restart bot in case of crash
-bot.infinity_polling(none_stop=True, timeout=50)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks of the bot
+Run from repository root: python -m benchmarks --help
+"""
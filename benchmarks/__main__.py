@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks import fixtures
+from benchmarks.fake_bot_api import FakeBotApi
+from settings import config
+
+"""
+Runs benchmark scenarios against synthetic database and fake Bot API,
+prints results and compares them with stored baseline
+
+    python -m benchmarks --users 10000 --save-baseline
+    python -m benchmarks --users 10000
+"""
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--courses', type=int, default=4)
+    parser.add_argument('--groups', type=int, default=2, help='groups in every course')
+    parser.add_argument('--lessons', type=int, default=4, help='lessons of every group per day')
+    parser.add_argument('--presses', type=int, default=5000, help='operations in NOW and /configure scenarios')
+    parser.add_argument('--import-rows', type=int, default=20000, help='rows of imported timetable file')
+    parser.add_argument('--search-lessons', type=int, default=50000, help='lessons in inline search index')
+    parser.add_argument('--shard-rates', default='200,400,800', help='updates per second replayed to shards')
+    parser.add_argument('--replay-seconds', type=float, default=2, help='duration of every replay step')
+    parser.add_argument('--replay-file', help='recorded updates, one JSON update per line, generated by default')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every fake Bot API request takes')
+    parser.add_argument('--scenario', action='append', help='run only given scenarios')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed throughput drop against baseline')
+    return parser.parse_args()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns names of scenarios which throughput dropped more than tolerance
+
+    :param results: {name: dict}
+    :param baseline: {name: dict}
+    :param tolerance: float
+    :return: [string]
+    """
+    return [name for name, result in results.items()
+            if name in baseline and result['throughput'] < baseline[name]['throughput'] * (1 - tolerance)]
+
+
+def main():
+    options = parse_args()
+    directory = tempfile.mkdtemp(prefix='schedulebot-bench-')
+    config.DB_FILE_NAME = os.path.join(directory, 'db.sqlite')
+    config.REGISTERED_COURSES = fixtures.generate(config.DB_FILE_NAME, options.users, options.courses,
+                                                  options.groups, options.lessons)
+    fake_api = FakeBotApi(latency=options.latency).start()
+    config.BOT_API_URL = fake_api.url
+
+    # modules read settings on import, so they are imported after settings are changed
+    from benchmarks.scenarios import SCENARIOS
+    from modules import migrations
+    migrations.migrate()
+
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        if options.scenario and name not in options.scenario:
+            continue
+        results[name] = scenario(options, fake_api)
+        print(f"{name:20} {json.dumps(results[name])}")
+    fake_api.stop()
+
+    if options.save_baseline:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {options.baseline}")
+        return
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        if regressions:
+            print(f"REGRESSION: {', '.join(regressions)}")
+            sys.exit(1)
+        print("no regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+"""
+Local fake of telegram Bot API. Answers like telegram and records sent messages and photos
+Bot is pointed to it by config.BOT_API_URL = 'http://127.0.0.1:<port>/bot{0}/{1}'
+"""
+
+
+class FakeBotApi:
+    """
+    Fake Bot API server running in background thread
+    """
+
+    def __init__(self, port=0, latency=0.0):
+        """
+        :param port: int, 0 - any free port
+        :param latency: float seconds every request takes, imitates network
+        """
+        self.latency = latency
+        self.calls = []  # [(method, params)]
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        """
+        Value for config.BOT_API_URL
+        """
+        return f"http://127.0.0.1:{self.server.server_address[1]}/bot{{0}}/{{1}}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, method):
+        with self.lock:
+            return sum(1 for name, _ in self.calls if name == method)
+
+    def answer(self, method, params):
+        """
+        Returns result telegram would return for request
+
+        :param method: string
+        :param params: dict
+        :return: dict
+        """
+        with self.lock:
+            self.calls.append((method, params))
+        if method in ('sendMessage', 'sendPhoto'):
+            chat_id = int(params.get('chat_id', 0))
+            message = {'message_id': next(self.message_ids), 'date': int(time.time()),
+                       'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+            if method == 'sendPhoto':
+                message['photo'] = [{'file_id': f"photo-{chat_id}", 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+            return message
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        return True
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlsplit(self.path)
+                method = url.path.rsplit('/', 1)[-1]
+                # telebot sends parameters in query string, other clients in body
+                params = {key: value[0] for key, value in parse_qs(url.query).items()}
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('application/json'):
+                    params.update(json.loads(body or b'{}'))
+                elif content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update({key: value[0] for key, value in parse_qs(body.decode()).items()})
+                # multipart uploads are recorded without parsing the body
+                if fake.latency:
+                    time.sleep(fake.latency)
+                data = json.dumps({'ok': True, 'result': fake.answer(method, params)}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
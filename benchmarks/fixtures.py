@@ -0,0 +1,82 @@
+import random
+import sqlite3
+
+"""
+Synthetic database fixtures with the same schema as db.sqlite
+"""
+
+SCHEMA = [
+    """CREATE TABLE users (
+        telegram_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT UNIQUE,
+        telegram_alias TEXT,
+        course TEXT,
+        course_group TEXT,
+        english_group TEXT,
+        need_reminders INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE group_lessons (
+        course TEXT, day INTEGER, subject TEXT, type INTEGER, teacher TEXT,
+        teacher_gender INTEGER DEFAULT 0, start TEXT, end TEXT, room INTEGER, lesson_group TEXT)""",
+    """CREATE TABLE common_lessons (
+        course TEXT NOT NULL, day INTEGER NOT NULL, subject TEXT NOT NULL, type INTEGER NOT NULL,
+        teacher TEXT NOT NULL, teacher_gender INTEGER DEFAULT 0, start TEXT NOT NULL, end TEXT NOT NULL,
+        room INTEGER NOT NULL)""",
+]
+
+SUBJECTS = ('Calculus', 'Electronics', 'Signals', 'Networks', 'Databases', 'French', 'Physics', 'Drawing')
+TEACHERS = ('Danquah', 'Boakye', 'Effah', 'Mensah', 'Motey', 'Darko', 'Frempong')
+
+
+def make_courses(courses, groups):
+    """
+    Returns course structure like config.REGISTERED_COURSES
+
+    :param courses: int
+    :param groups: int groups in every course
+    :return: {course: [group]}
+    """
+    return {f"Lvl {course + 1}00": [f"Group {group + 1}" for group in range(groups)] for course in range(courses)}
+
+
+def generate(path, users=1000, courses=4, groups=2, lessons_per_day=4, days=6, seed=1):
+    """
+    Creates database file filled with synthetic users and timetable
+
+    :param path: string
+    :param users: int
+    :param courses: int
+    :param groups: int groups in every course
+    :param lessons_per_day: int lessons of every group every day, one of them is common for the course
+    :param days: int
+    :param seed: int
+    :return: {course: [group]} generated courses
+    """
+    rand = random.Random(seed)
+    registered = make_courses(courses, groups)
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    common, group_rows = [], []
+    for course, course_groups in registered.items():
+        for day in range(days):
+            # the first lesson of the day is common for the course
+            common.append((course, day, rand.choice(SUBJECTS), 0, rand.choice(TEACHERS), rand.randint(0, 1),
+                           "8:00", "9:30", rand.randint(100, 400)))
+            for course_group in course_groups:
+                for i in range(1, lessons_per_day):
+                    start = 8 + i * 2
+                    group_rows.append((course, day, rand.choice(SUBJECTS), rand.randint(0, 2), rand.choice(TEACHERS),
+                                       rand.randint(0, 1), f"{start}:00", f"{start + 1}:30", rand.randint(100, 400),
+                                       course_group))
+    conn.executemany("INSERT INTO common_lessons VALUES (?,?,?,?,?,?,?,?,?)", common)
+    conn.executemany("INSERT INTO group_lessons VALUES (?,?,?,?,?,?,?,?,?,?)", group_rows)
+
+    user_rows = []
+    for user_id in range(1, users + 1):
+        course = rand.choice(list(registered))
+        user_rows.append((user_id, f"user{user_id}", course, rand.choice(registered[course]), None,
+                          1 if rand.random() < 0.8 else 0))
+    conn.executemany("INSERT INTO users VALUES (?,?,?,?,?,?)", user_rows)
+    conn.commit()
+    conn.close()
+    return registered
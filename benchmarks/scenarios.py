@@ -0,0 +1,736 @@
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+"""
+Benchmark scenarios. Modules of the bot are imported inside scenarios,
+after settings are pointed to synthetic database by __main__
+"""
+
+
+def percentile(values, percent):
+    """
+    :param values: [float] sorted
+    :param percent: int [0-100]
+    :return: float
+    """
+    if not values:
+        return 0
+    return values[max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))]
+
+
+def summarize(latencies, seconds):
+    """
+    Returns throughput and latency percentiles in milliseconds
+
+    :param latencies: [float] seconds of every operation
+    :param seconds: float total time
+    :return: dict
+    """
+    latencies = sorted(latencies)
+    return {'ops': len(latencies),
+            'seconds': round(seconds, 3),
+            'throughput': round(len(latencies) / seconds, 1) if seconds else 0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3)}
+
+
+def run_concurrently(operation, arguments, threads):
+    """
+    Runs operation for every argument on thread pool and measures every call
+
+    :param operation: function(argument)
+    :param arguments: [object]
+    :param threads: int
+    :return: dict, see summarize
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def measure(argument):
+        started = time.perf_counter()
+        operation(argument)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(measure, arguments))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def peak_now_presses(options, fake_api):
+    """
+    Many users press NOW and TODAY at the same moment
+    """
+    from modules import replies
+    from modules import user_controller
+
+    rand = random.Random(2)
+    user_ids = [rand.randint(1, options.users) for _ in range(options.presses)]
+    moment = datetime(2026, 10, 19, 9, 55)  # monday, right before classes
+
+    def press(user_id):
+        user = user_controller.get(user_id)
+        replies.get_now_reply(user.course, user.course_group, moment)
+        replies.get_day_reply(user.course, user.course_group, moment.weekday())
+
+    return run_concurrently(press, user_ids, options.threads)
+
+
+def reply_cache(options, fake_api):
+    """
+    Cost of one NOW and TODAY reply rendered from timetable against taken from reply cache
+    """
+    from modules import replies
+    from settings import config
+
+    cohorts = [(course, course_group) for course, course_groups in config.REGISTERED_COURSES.items()
+               for course_group in course_groups]
+    moment = datetime(2026, 10, 19, 9, 55)
+
+    def render(cohort):
+        replies.clear()
+        replies.get_now_reply(*cohort, moment)
+        replies.get_day_reply(*cohort, moment.weekday())
+
+    def cached(cohort):
+        replies.get_now_reply(*cohort, moment)
+        replies.get_day_reply(*cohort, moment.weekday())
+
+    presses = [cohorts[i % len(cohorts)] for i in range(options.presses)]
+    rendered = run_concurrently(render, presses, 1)
+    result = run_concurrently(cached, presses, 1)
+    result['render_p50_ms'] = rendered['p50_ms']
+    result['render_p99_ms'] = rendered['p99_ms']
+    return result
+
+
+def reminder_tick(options, fake_api):
+    """
+    Reminders of one remind time for all subscribers, delivered to fake Bot API
+    Telegram rate limits are lifted to measure the bot itself
+    """
+    from modules import delivery
+    from modules import lesson_controller
+    from settings import config
+    from settings import strings
+
+    delivery.global_limiter = delivery.TokenBucket(10 ** 6, 10 ** 6)
+    delivery.chat_limiter = delivery.ChatLimiter(0)
+    send_url = fake_api.url.format('TOKEN', 'sendMessage')
+
+    def send(chat_id, text):
+        request = urllib.request.Request(send_url, json.dumps({'chat_id': chat_id, 'text': text}).encode(),
+                                         {'Content-Type': 'application/json'})
+        urllib.request.urlopen(request).read()
+
+    # every synthetic group has a lesson at 10:00
+    at = datetime(2026, 10, 19, 10, 0) - timedelta(minutes=config.REMIND_WHEN_LEFT_MINUTES)
+    started = time.perf_counter()
+    planned = lesson_controller.get_relevant_reminders(at)
+    planning = time.perf_counter() - started
+    report = delivery.send_all(send, [(user_id, strings.HEADER_REMIND + str(lesson)) for user_id, lesson in planned])
+    seconds = time.perf_counter() - started
+    return {'ops': report['sent'],
+            'seconds': round(seconds, 3),
+            'throughput': round(report['sent'] / seconds, 1) if seconds else 0,
+            'planning_ms': round(planning * 1000, 3),
+            'p50_ms': round(report['p50'] * 1000, 3),
+            'p95_ms': round(report['p95'] * 1000, 3),
+            'p99_ms': round(report['p99'] * 1000, 3)}
+
+
+def reminder_scaling(options, fake_api):
+    """
+    Planning of one remind time with 1k, 10k and 100k subscribers, nothing is sent
+    Number of queries of a tick does not depend on number of users,
+    time grows only with number of users who are reminded
+    """
+    from modules import db
+    from modules import lesson_controller
+    from settings import config
+
+    cohorts = [(course, course_group) for course, course_groups in config.REGISTERED_COURSES.items()
+               for course_group in course_groups]
+    rand = random.Random(6)
+    # every synthetic group has a lesson at 10:00
+    at = datetime(2026, 10, 19, 10, 0) - timedelta(minutes=config.REMIND_WHEN_LEFT_MINUTES)
+    result = {}
+    latencies = []
+    db.execute("CREATE TABLE saved_users AS SELECT * FROM users")
+    db.execute("DELETE FROM users")
+    try:
+        count = 0
+        for size in (1000, 10000, 100000):
+            db.executemany("INSERT INTO users (telegram_id, telegram_alias, course, course_group, need_reminders, "
+                           "remind_lead) VALUES (?,?,?,?,1,?)",
+                           [(user_id, f"user{user_id}", *rand.choice(cohorts), rand.choice(config.REMIND_LEAD_OPTIONS))
+                            for user_id in range(count + 1, size + 1)])
+            count = size
+            lesson_controller.get_relevant_reminders(at)  # lessons of the date are grouped on the first tick
+            queries = db.get_query_count()
+            ticks = []
+            for _ in range(20):
+                started = time.perf_counter()
+                planned = lesson_controller.get_relevant_reminders(at)
+                ticks.append(time.perf_counter() - started)
+            latencies += ticks
+            result[f"tick_ms_{size}"] = round(percentile(sorted(ticks), 50) * 1000, 3)
+            result[f"queries_{size}"] = (db.get_query_count() - queries) // len(ticks)
+            result[f"reminded_{size}"] = len(planned)
+    finally:
+        db.execute("DELETE FROM users")
+        db.execute("INSERT INTO users SELECT * FROM saved_users")
+        db.execute("DROP TABLE saved_users")
+    summary = summarize(latencies, sum(latencies))
+    summary.update(result)
+    return summary
+
+
+def reminder_scheduler(options, fake_api):
+    """
+    Reminder scheduler driven by fake clock through two weeks, jumping straight to every wake up time
+    Checks that every remind time fires once, exactly at its time, and none fires on days without lessons
+    """
+    from modules import lesson_controller
+    from modules import reminder
+    from settings import config
+
+    now = [datetime(2026, 10, 19, 0, 0)]  # monday
+    end = now[0] + timedelta(days=14)
+    fired = []
+    scheduler = reminder.Scheduler(fired.append, clock=lambda: now[0])
+
+    expected = set()
+    for day in range(16):
+        moment = now[0].date() + timedelta(days=day)
+        for hour, minute in lesson_controller.get_start_times(moment):
+            for lead in config.REMIND_LEAD_OPTIONS:
+                remind_time = datetime(moment.year, moment.month, moment.day, hour, minute) - timedelta(minutes=lead)
+                if now[0] < remind_time <= end:
+                    expected.add(remind_time)
+
+    latencies = []
+    started = time.perf_counter()
+    while now[0] < end:
+        now[0] = min(end, now[0] + timedelta(seconds=scheduler.seconds_until_next()))
+        count = len(fired)
+        operation = time.perf_counter()
+        scheduler.run_pending()
+        latencies.append(time.perf_counter() - operation)
+        assert all(remind_time == now[0] for remind_time in fired[count:]), f"late reminder at {now[0]}"
+    result = summarize(latencies, time.perf_counter() - started)
+
+    assert len(fired) == len(set(fired)), "remind time fired twice"
+    assert set(fired) == expected, f"missed {sorted(expected - set(fired))[:3]}, extra {sorted(set(fired) - expected)[:3]}"
+    assert not any(remind_time.weekday() == 6 for remind_time in fired), "reminder on sunday without lessons"
+
+    # timetable change rebuilds the plan, remind times which already fired must not fire again
+    scheduler.rebuild()
+    scheduler.run_pending()
+    assert len(fired) == len(expected), "remind time fired again after rebuild"
+
+    # failed remind time is skipped, the next ones still fire
+    def fail_first(remind_time):
+        if not failed:
+            failed.append(remind_time)
+            raise RuntimeError("benchmark failure")
+        fired.append(remind_time)
+
+    failed = []
+    scheduler.call_when_needed = fail_first
+    count = len(fired)
+    for _ in range(2):
+        now[0] += timedelta(seconds=scheduler.seconds_until_next())
+        scheduler.run_pending()
+    assert failed and len(fired) > count, "scheduler stopped after failed remind time"
+    result['fired'] = count
+    return result
+
+
+def configure_storm(options, fake_api):
+    """
+    Many new users go through /configure dialog at the same time
+    """
+    from modules import conversation
+    from modules import user_controller
+
+    first_id = options.users + 1
+    user_ids = list(range(first_id, first_id + options.presses))
+
+    def configure(user_id):
+        user_controller.register(user_id, f"new{user_id}")
+        conversation.set_step(user_id, 'course')
+        user_controller.set_course(user_id, 'Lvl 100')
+        conversation.set_step(user_id, 'group')
+        user_controller.set_course_group(user_id, 'Group 1')
+        conversation.set_step(user_id, 'reminders')
+        user_controller.set_reminders(user_id, True)
+        conversation.clear(user_id)
+
+    return run_concurrently(configure, user_ids, options.threads)
+
+
+def inline_search(options, fake_api):
+    """
+    Inline queries of users typing subject, teacher or room over a big timetable
+    The index is built from --search-lessons synthetic lessons, budget is sub-millisecond lookup.
+    Half of queries come with course group of the user, so its own lessons are searched first
+    """
+    from modules import lesson_controller
+    from modules import lesson_search
+    from modules.lesson import Lesson
+    from settings import config
+
+    rand = random.Random(4)
+    courses = list(config.REGISTERED_COURSES)
+    timetable = {}
+    for i in range(options.search_lessons):
+        course = rand.choice(courses)
+        start = rand.randint(8, 18)
+        lesson = Lesson((f"Subject{i % 2000} {rand.choice(('Theory', 'Practice', 'Design'))}", rand.randint(0, 2),
+                         f"Teacher{i % 300}", rand.randint(0, 1), f"{start}:00", f"{start + 1}:30",
+                         rand.randint(100, 400)))
+        key = (course, rand.choice(config.REGISTERED_COURSES[course]), rand.randint(0, 5))
+        timetable.setdefault(key, []).append(lesson)
+    timetable = {key: tuple(sorted(lessons)) for key, lessons in timetable.items()}
+    started = time.perf_counter()
+    index = lesson_search.SearchIndex(timetable)
+    build = time.perf_counter() - started
+
+    queries = []
+    for _ in range(options.presses):
+        word = rand.choice((f"subject{rand.randint(0, 1999)}", f"teacher{rand.randint(0, 299)}",
+                            str(rand.randint(100, 400)), 'theory', 'des', 'subject1 prac'))
+        course = rand.choice(courses)
+        queries.append((word[:rand.randint(1, len(word))], rand.randint(0, 7 * 24 * 60 - 1),
+                        course, rand.choice(config.REGISTERED_COURSES[course]) if rand.random() < 0.5 else None))
+
+    # search of the module takes lessons from the current timetable, so synthetic one is made current
+    previous = lesson_controller.state
+    lesson_controller.state = lesson_controller.TimetableState(-1, timetable, {})
+    try:
+        # the first searches build indexes of the state and of every group, the whole index is measured above
+        for course, course_groups in config.REGISTERED_COURSES.items():
+            for course_group in course_groups:
+                lesson_search.search('warm up', course, course_group)
+        latencies = []
+        started = time.perf_counter()
+        for query, week_minute, course, course_group in queries:
+            moment = datetime(2026, 9, 7) + timedelta(minutes=week_minute)  # 2026-09-07 is monday
+            operation = time.perf_counter()
+            if course_group is None:
+                index.search(query, week_minute)
+            else:
+                lesson_search.search(query, course, course_group, moment)
+            latencies.append(time.perf_counter() - operation)
+        seconds = time.perf_counter() - started
+    finally:
+        lesson_controller.state = previous
+    result = summarize(latencies, seconds)
+    result['build_ms'] = round(build * 1000, 3)
+    assert result['p99_ms'] < 1, f"inline search p99 {result['p99_ms']} ms is over 1 ms budget"
+    return result
+
+
+def lesson_construction(options, fake_api):
+    """
+    Making lessons from database rows and printing them for NOW reply, current Lesson against the old class
+    which parsed times and called datetime.now() in every lesson
+    """
+    from benchmarks.old_lesson import Lesson as OldLesson
+    from modules.lesson import Lesson, minutes_since_midnight
+
+    rand = random.Random(7)
+    rows = []
+    for i in range(options.presses):
+        start = rand.randint(8, 18)
+        rows.append((f"Subject {i}", rand.randint(0, 2), f"Teacher {i % 100}", rand.randint(0, 1),
+                     f"{start}:00", f"{start + 1}:30", rand.randint(100, 400)))
+
+    def measure(make):
+        latencies = []
+        started = time.perf_counter()
+        for row in rows:
+            operation = time.perf_counter()
+            make(row)
+            latencies.append(time.perf_counter() - operation)
+        return summarize(latencies, time.perf_counter() - started)
+
+    def make_new(row):
+        Lesson(row).get_str_current(minutes_since_midnight())
+
+    def make_old(row):
+        OldLesson(row).get_str_current()
+
+    old = measure(make_old)
+    result = measure(make_new)
+    result['old_p50_ms'] = old['p50_ms']
+    result['old_throughput'] = old['throughput']
+    result['speedup'] = round(result['throughput'] / old['throughput'], 1) if old['throughput'] else 0
+    return result
+
+
+def webhook_load(options, fake_api):
+    """
+    Synthetic NOW presses pushed to local webhook server, handled by real handlers of the bot
+    Reports updates per second and latency of handling one update
+    """
+    import asyncio
+    from aiohttp import web
+    import GTClassAlert
+    from modules import webhook
+    from settings import config
+    from settings import strings
+
+    config.WEBHOOK_SECRET = 'benchmark'
+    handled = []
+    lock = threading.Lock()
+    all_handled = threading.Event()
+    process_update = webhook.process_update
+
+    def measured(bot, raw_update):
+        started = time.perf_counter()
+        process_update(bot, raw_update)
+        elapsed = time.perf_counter() - started
+        with lock:
+            handled.append(elapsed)
+            if len(handled) == options.presses:
+                all_handled.set()
+
+    # lanes of the webhook app call process_update of the module
+    webhook.process_update = measured
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(webhook.make_app(GTClassAlert.bot))
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    rand = random.Random(5)
+
+    def push(update_id):
+        user_id = rand.randint(1, options.users)
+        update = {'update_id': update_id,
+                  'message': {'message_id': update_id, 'date': int(time.time()), 'text': strings.TEXT_BUTTON_NOW,
+                              'chat': {'id': user_id, 'type': 'private'},
+                              'from': {'id': user_id, 'is_bot': False, 'first_name': 'User',
+                                       'username': f"user{user_id}"}}}
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{config.WEBHOOK_PATH}", json.dumps(update).encode(),
+                                         {'Content-Type': 'application/json',
+                                          webhook.SECRET_HEADER: config.WEBHOOK_SECRET})
+        urllib.request.urlopen(request).read()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.threads) as executor:
+        list(executor.map(push, range(1, options.presses + 1)))
+    all_handled.wait()
+    seconds = time.perf_counter() - started
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    webhook.process_update = process_update
+    result = summarize(handled, seconds)
+    result['sent_messages'] = fake_api.count('sendMessage')
+    return result
+
+
+def sharded_replay(options, fake_api):
+    """
+    Update stream replayed at stepped rates to ShardedDispatcher with 1, 2 and 4 worker processes,
+    handled by real handlers of the bot. Reports throughput and latency of every step,
+    checks that updates of every chat are handled in order they came and that metrics of workers are collected
+    """
+    import multiprocessing
+    import GTClassAlert
+    from modules import metrics
+    from modules import sharding
+    from modules import webhook
+    from settings import strings
+
+    if options.replay_file:
+        with open(options.replay_file) as f:
+            stream = [json.loads(line) for line in f if line.strip()]
+    else:
+        rand = random.Random(8)
+        stream = []
+        for number in range(1, 10001):
+            # chats repeat often, so their order is checked
+            user_id = rand.randint(1, min(options.users, 500))
+            stream.append({'message': {'message_id': number, 'date': int(time.time()), 'text': strings.TEXT_BUTTON_NOW,
+                                       'chat': {'id': user_id, 'type': 'private'},
+                                       'from': {'id': user_id, 'is_bot': False, 'first_name': 'User',
+                                                'username': f"user{user_id}"}}})
+
+    # workers are forked with this wrapper and report every handled update
+    handled = multiprocessing.get_context('fork').Queue()
+    process_update = webhook.process_update
+
+    def reported(bot, raw_update):
+        try:
+            process_update(bot, raw_update)
+        finally:
+            handled.put((raw_update['update_id'], sharding.get_chat_id(raw_update), time.perf_counter()))
+
+    webhook.process_update = reported
+    result = {}
+    latencies = []
+    started = time.perf_counter()
+    update_id = 0
+    try:
+        for workers in (1, 2, 4):
+            dispatcher = sharding.ShardedDispatcher(GTClassAlert.bot, workers)
+            dispatcher.start()
+            first_id = update_id
+            try:
+                for rate in (int(rate) for rate in options.shard_rates.split(',')):
+                    count = int(rate * options.replay_seconds)
+                    sent = {}
+                    step = time.perf_counter()
+                    for i in range(count):
+                        delay = step + i / rate - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                        update_id += 1
+                        raw_update = dict(stream[i % len(stream)], update_id=update_id)
+                        sent[update_id] = time.perf_counter()
+                        dispatcher.dispatch(raw_update)
+                    last_ids = {}
+                    step_latencies = []
+                    finished = step
+                    for _ in range(count):
+                        handled_id, chat_id, finished = handled.get(timeout=60)
+                        assert handled_id > last_ids.get(chat_id, 0), f"update {handled_id} of chat {chat_id} " \
+                                                                       f"handled after {last_ids[chat_id]}"
+                        last_ids[chat_id] = handled_id
+                        step_latencies.append(finished - sent[handled_id])
+                    latencies += step_latencies
+                    step_result = summarize(step_latencies, finished - step)
+                    result[f"shards{workers}_rate{rate}_throughput"] = step_result['throughput']
+                    result[f"shards{workers}_rate{rate}_p99_ms"] = step_result['p99_ms']
+                counters, histograms = metrics.collect()
+                handlers = sum(value[-1] for (name, _), value in histograms.items()
+                               if name == 'handler_latency_seconds')
+                assert handlers >= update_id - first_id, \
+                    f"metrics of workers show {handlers} of {update_id - first_id} updates"
+            finally:
+                dispatcher.stop()
+    finally:
+        webhook.process_update = process_update
+    summary = summarize(latencies, time.perf_counter() - started)
+    summary.update(result)
+    return summary
+
+
+def query_plans(options, fake_api):
+    """
+    Hot queries of the bot must be index lookups: the query is taken from the function making it
+    and its EXPLAIN QUERY PLAN is checked to use the expected index, then reads are timed
+    """
+    from modules import conversation
+    from modules import db
+    from modules import user_controller
+    from settings import config
+
+    course = next(iter(config.REGISTERED_COURSES))
+    course_group = config.REGISTERED_COURSES[course][0]
+    checks = [
+        ('user', lambda: user_controller.get(options.users + 10 ** 6), 'INTEGER PRIMARY KEY'),
+        ('alias', lambda: user_controller.get_id_by_alias('user1'), 'users_alias'),
+        ('reminder_cohorts', lambda: user_controller.get_reminder_cohorts(
+            [(course, course_group, config.REMIND_WHEN_LEFT_MINUTES)]), 'users_reminders'),
+        ('broadcast_recipients', lambda: next(user_controller.iter_user_ids(course, course_group), None),
+         'users_cohort'),
+        ('expire_conversations', conversation.expire, 'conversation_state_updated'),
+    ]
+
+    # queries are recorded instead of being executed
+    recorded = []
+    functions = db.fetchone, db.fetchall, db.execute
+    db.fetchone = lambda sql, params=(): recorded.append((sql, params))
+    db.fetchall = lambda sql, params=(): recorded.append((sql, params)) or []
+    db.execute = lambda sql, params=(): recorded.append((sql, params))
+    queries = []
+    try:
+        for name, call, index in checks:
+            del recorded[:]
+            call()
+            queries.append((name, *recorded[0], index))
+    finally:
+        db.fetchone, db.fetchall, db.execute = functions
+
+    result = {}
+    latencies = []
+    started = time.perf_counter()
+    for name, sql, params, index in queries:
+        plan = ' '.join(row[3] for row in db.fetchall(f"EXPLAIN QUERY PLAN {sql}", params))
+        assert f"USING {index}" in plan or f"INDEX {index}" in plan, f"{name} does not use {index}: {plan}"
+        if not sql.startswith('SELECT'):
+            continue
+        timings = []
+        for _ in range(200):
+            operation = time.perf_counter()
+            db.fetchall(sql, params)
+            timings.append(time.perf_counter() - operation)
+        latencies += timings
+        result[f"{name}_ms"] = round(percentile(sorted(timings), 50) * 1000, 4)
+    summary = summarize(latencies, time.perf_counter() - started)
+    summary.update(result)
+    return summary
+
+
+def import_time(options, fake_api):
+    """
+    Startup cost: `python -X importtime -c "import GTClassAlert"` in fresh interpreters
+    Reports time of importing the bot and its slowest modules,
+    checks that heavy optional dependencies are imported only when they are used
+    """
+    lazy = ('aiohttp', 'cloudinary', 'PIL.Image')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    latencies = []
+    modules = {}
+    started = time.perf_counter()
+    for _ in range(5):
+        report = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import GTClassAlert'], cwd=root,
+                                capture_output=True, text=True, check=True).stderr
+        # lines are "import time: self [us] | cumulative | imported package", nested modules are indented
+        modules = {}
+        for line in report.splitlines()[1:]:
+            own, cumulative, name = line.partition(':')[2].split('|')
+            modules[name.strip()] = (int(own), int(cumulative))
+        latencies.append(modules['GTClassAlert'][1] / 10 ** 6)
+    result = summarize(latencies, time.perf_counter() - started)
+    imported = [name for name in lazy if name in modules]
+    assert not imported, f"imported on startup: {', '.join(imported)}"
+    result['slowest'] = [f"{name} {own / 1000:.1f}ms"
+                         for name, (own, _) in sorted(modules.items(), key=lambda item: -item[1][0])[:5]]
+    return result
+
+
+def timetable_import(options, fake_api):
+    """
+    Import of big timetable file replacing the whole timetable
+    """
+    from modules import lesson_controller
+    from modules import timetable_import as importer
+    from settings import config
+
+    rand = random.Random(3)
+    path = os.path.join(os.path.dirname(config.DB_FILE_NAME), 'timetable.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=importer.FIELDS)
+        writer.writeheader()
+        for i in range(options.import_rows):
+            course = rand.choice(list(config.REGISTERED_COURSES))
+            start = rand.randint(8, 18)
+            writer.writerow({'course': course, 'lesson_group': rand.choice(config.REGISTERED_COURSES[course] + ['']),
+                             'day': rand.randint(0, 5), 'subject': f"Subject {i}", 'type': rand.randint(0, 2),
+                             'teacher': f"Teacher {i % 100}", 'teacher_gender': rand.randint(0, 1),
+                             'start': f"{start}:00", 'end': f"{start + 1}:30", 'room': rand.randint(100, 400)})
+    started = time.perf_counter()
+    result = importer.import_timetable(path)
+    imported = time.perf_counter() - started
+    lesson_controller.refresh_if_changed()
+    seconds = time.perf_counter() - started
+    rows = result['common'] + result['group']
+    return {'ops': rows,
+            'seconds': round(seconds, 3),
+            'throughput': round(rows / imported, 1),
+            'import_ms': round(imported * 1000, 3),
+            'reload_ms': round((seconds - imported) * 1000, 3)}
+
+
+def timetable_upload(options, fake_api):
+    """
+    Sync of timetable images with stub uploader taking --latency seconds per image:
+    only changed images are uploaded, failed upload keeps successful ones in manifest
+    and sync without changes uploads nothing
+    """
+    import cinary
+    from settings import config
+
+    directory = os.path.join(os.path.dirname(config.DB_FILE_NAME), 'timetables')
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, f"{i}.png") for i in range(40)]
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(os.urandom(1024))
+
+    uploads = []
+    failing = set()
+    lock = threading.Lock()
+
+    def upload(path):
+        time.sleep(options.latency)
+        if path in failing:
+            raise ConnectionError(f"upload of {path} failed")
+        with lock:
+            uploads.append(path)
+        return f"https://example.com/{len(uploads)}/{os.path.basename(path)}"
+
+    def sync():
+        uploads.clear()
+        started = time.perf_counter()
+        try:
+            cinary.sync_timetables(paths, upload)
+        finally:
+            latencies.append(time.perf_counter() - started)
+        return sorted(uploads)
+
+    manifest_name = cinary.TIMETABLE_MANIFEST_FILE_NAME
+    cinary.TIMETABLE_MANIFEST_FILE_NAME = os.path.join(directory, 'manifest.json')
+    latencies = []
+    try:
+        assert sync() == sorted(paths), "first sync must upload every image"
+        changed = paths[::4]
+        for path in changed:
+            with open(path, 'ab') as f:
+                f.write(b'changed')
+        failing.add(changed[0])
+        try:
+            sync()
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("failed upload must be raised")
+        assert sorted(uploads) == sorted(changed[1:]), "only changed images must be uploaded"
+        manifest = cinary.load_manifest()
+        assert all(manifest[path]['hash'] == cinary.file_hash(path) for path in changed[1:]), \
+            "successful uploads must be kept in manifest when another one fails"
+        assert manifest[changed[0]]['hash'] != cinary.file_hash(changed[0])
+        failing.clear()
+        assert sync() == [changed[0]], "failed image must be uploaded by the next sync"
+        assert sync() == [], "sync without changes must upload nothing"
+    finally:
+        cinary.TIMETABLE_MANIFEST_FILE_NAME = manifest_name
+    return summarize(latencies, sum(latencies))
+
+
+SCENARIOS = {
+    'peak_now_presses': peak_now_presses,
+    'reply_cache': reply_cache,
+    'reminder_tick': reminder_tick,
+    'reminder_scaling': reminder_scaling,
+    'reminder_scheduler': reminder_scheduler,
+    'configure_storm': configure_storm,
+    'inline_search': inline_search,
+    'lesson_construction': lesson_construction,
+    'webhook_load': webhook_load,
+    'sharded_replay': sharded_replay,
+    'query_plans': query_plans,
+    'import_time': import_time,
+    'timetable_upload': timetable_upload,
+    # replaces timetable, so runs the last
+    'timetable_import': timetable_import,
+}
@@ -1,38 +1,120 @@
+import hashlib
+import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from cloudinary.api import resources_by_tag, delete_resources_by_tag
-from cloudinary.uploader import upload
-from cloudinary.utils import cloudinary_url
+from settings.config import TIMETABLE_PHOTOS, TIMETABLE_MANIFEST_FILE_NAME, UPLOAD_WORKERS
 
-os.chdir(os.path.join(os.path.dirname(sys.argv[0]), '.'))
-if os.path.exists('cloud_settings.py'):
-    exec(open('cloud_settings.py').read())
+"""
+Uploads timetable images to cloudinary
+Only images changed since the last upload are uploaded, in parallel.
+Hash and url of every uploaded image are kept in manifest file
+"""
 
 DEFAULT_TAG = "time_table"
 
 
-def upload_timetables(loader):
-    urls = []
-    for i in loader:
-        response = upload(i, tags=DEFAULT_TAG)
-        url, options = cloudinary_url(
-            response['public_id'],
-            format=response['format'],
-            width=3000,
-            crop="scale"
-        )
-        urls.append(url)
-    write_urls_to_file(urls)
+def configure():
+    """
+    Configures cloudinary account from cloud_settings.py if it exists
+    """
+    if os.path.exists('cloud_settings.py'):
+        exec(open('cloud_settings.py').read())
 
 
-def write_urls_to_file(urls):
-    with open('url_dump.txt', 'w') as outfile:
-        for url in urls:
-            outfile.write(url + '\n')
+def file_hash(path):
+    """
+    Returns sha256 of file content
+
+    :param path: string
+    :return: string
+    """
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest():
+    """
+    Returns manifest of uploaded images
+
+    :return: {path: {'hash': string, 'url': string}}
+    """
+    if not os.path.exists(TIMETABLE_MANIFEST_FILE_NAME):
+        return {}
+    with open(TIMETABLE_MANIFEST_FILE_NAME) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    """
+    Writes manifest to temporary file and replaces the old one,
+    so bot never reads half written manifest
+
+    :param manifest: {path: {'hash': string, 'url': string}}
+    """
+    temp_name = TIMETABLE_MANIFEST_FILE_NAME + '.tmp'
+    with open(temp_name, 'w') as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+    os.replace(temp_name, TIMETABLE_MANIFEST_FILE_NAME)
+
+
+def upload_file(path):
+    """
+    Uploads one image to cloudinary, replacing its previous version
+
+    :param path: string
+    :return: string url of uploaded image
+    """
+    from cloudinary.uploader import upload
+    from cloudinary.utils import cloudinary_url
+
+    public_id = os.path.splitext(os.path.basename(path))[0]
+    response = upload(path, public_id=public_id, tags=DEFAULT_TAG, overwrite=True, invalidate=True)
+    # version makes url of every upload unique, so telegram does not reuse old image
+    url, options = cloudinary_url(
+        response['public_id'],
+        format=response['format'],
+        version=response['version'],
+        width=3000,
+        crop="scale"
+    )
+    return url
+
+
+def sync_timetables(paths, upload=upload_file):
+    """
+    Uploads images, which were changed since the last upload, and updates manifest
+    If some uploads fail, manifest is still saved with all successful ones and the first error is raised,
+    so the next sync uploads only failed images
+
+    :param paths: [string] local image files
+    :param upload: function(path: string) returning url, uploads image
+    :return: [string] uploaded files
+    """
+    manifest = load_manifest()
+    hashes = {path: file_hash(path) for path in paths}
+    changed = [path for path in paths if manifest.get(path, {}).get('hash') != hashes[path]]
+    error = None
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {executor.submit(upload, path): path for path in changed}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                manifest[path] = {'hash': hashes[path], 'url': future.result()}
+            except Exception as exception:
+                error = error or exception
+    # forget images which are not used anymore
+    manifest = {path: manifest[path] for path in paths if path in manifest}
+    save_manifest(manifest)
+    if error:
+        raise error
+    return changed
 
 
 def cleanup():
+    from cloudinary.api import resources_by_tag, delete_resources_by_tag
+
     response = resources_by_tag(DEFAULT_TAG)
     resources = response.get('resources', [])
     if not resources:
@@ -40,11 +122,15 @@ def cleanup():
         return
     print("Deleting {0:d} images...".format(len(resources)))
     delete_resources_by_tag(DEFAULT_TAG)
+    if os.path.exists(TIMETABLE_MANIFEST_FILE_NAME):
+        os.remove(TIMETABLE_MANIFEST_FILE_NAME)
     print("Done!")
 
 
 if __name__ == '__main__':
-    load = ['photos/Lvl100.png', 'photos/Lvl200.png', 'photos/Lvl300BCE.png',
-            'photos/Lvl300BTE.png', 'photos/Lvl400BCE.png', 'photos/Lvl400BTE.png']
-    cleanup()
-    upload_timetables(load)
+    os.chdir(os.path.join(os.path.dirname(sys.argv[0]), '.'))
+    configure()
+    if '--cleanup' in sys.argv:
+        cleanup()
+    uploaded = sync_timetables(sorted(set(TIMETABLE_PHOTOS.values())))
+    print("Uploaded {0:d} images".format(len(uploaded)))
@@ -1,5 +1,9 @@
-import logging
-from settings.config import LOGGER_NAME
+import threading
+
+from modules import broadcast
+from modules.logs import logged_handler
+from settings import config
+from settings import strings
 
 
 def register_admin_commands(bot):
@@ -10,16 +14,59 @@ def register_admin_commands(bot):
 
     :param bot: Telebot
     """
-    logger = logging.getLogger(LOGGER_NAME)
+
+    def is_admin(message):
+        return message.from_user.id in config.ADMINS or message.from_user.username in config.ADMINS
+
+    def send(chat_id, text):
+        bot.send_message(chat_id, text)
+
+    def run_broadcast(admin_chat_id, broadcast_id):
+        """
+        Sends broadcast in background thread and reports result to admin
+        """
+        report = broadcast.run(broadcast_id, send)
+        bot.send_message(admin_chat_id, strings.ADMIN_BROADCAST_DONE.format(
+            broadcast_id, report['sent'], report['failed'], report['blocked'], report['throughput']))
 
     @bot.message_handler(commands=['admin'])
+    @logged_handler
     def admin(message):
-        log(message)
         bot.send_message(message.chat.id, u"Hi, admin!")
 
-    def log(message):
+    @bot.message_handler(commands=['broadcast'], func=is_admin)
+    @logged_handler
+    def broadcast_handler(message):
+        """
+        /broadcast text - to everyone
+        /broadcast course | group
+        text - to course group, group could be omitted
+        """
+        command, _, text = message.text.partition(' ')
+        course = course_group = None
+        first_line, newline, rest = text.partition('\n')
+        if newline and first_line.split('|')[0].strip() in config.REGISTERED_COURSES:
+            course, _, course_group = (part.strip() for part in first_line.partition('|'))
+            text = rest
+        if not text.strip():
+            bot.send_message(message.chat.id, strings.ADMIN_BROADCAST_USAGE)
+            return
+        broadcast_id = broadcast.create(text, course, course_group or None)
+        bot.send_message(message.chat.id, strings.ADMIN_BROADCAST_STARTED.format(broadcast_id))
+        threading.Thread(target=run_broadcast, args=(message.chat.id, broadcast_id), daemon=True).start()
+
+    @bot.message_handler(commands=['broadcast_resume'], func=is_admin)
+    @logged_handler
+    def broadcast_resume_handler(message):
         """
-        Write log info about admin message to file
+        Continues broadcasts interrupted by restart
         """
-        logger.info(f"ADMIN {message.from_user.username} :: {message.from_user.id} :: "
-                    f"{message.text if message.text else '--not_text--'}")
+        unfinished = broadcast.get_unfinished()
+        if not unfinished:
+            bot.send_message(message.chat.id, strings.ADMIN_BROADCAST_NOTHING)
+        for broadcast_id in unfinished:
+            # broadcast could be resumed by another admin at the same time
+            if not broadcast.claim(broadcast_id):
+                continue
+            bot.send_message(message.chat.id, strings.ADMIN_BROADCAST_STARTED.format(broadcast_id))
+            threading.Thread(target=run_broadcast, args=(message.chat.id, broadcast_id), daemon=True).start()
@@ -0,0 +1,94 @@
+import time
+import uuid
+
+from modules import db
+from modules import delivery
+from modules import user_controller
+from settings.config import BROADCAST_BATCH_SIZE
+
+"""
+Admin broadcasts: one message sent to all users or to users of course (group)
+Recipients are read from database in batches, progress is saved after every batch,
+so broadcast interrupted by restart continues from the last sent user.
+
+Statuses: sending - claimed by a sender thread, interrupted - sender stopped before the end, done.
+Interrupted broadcast is claimed atomically before resume, so it is never sent by two threads
+"""
+
+
+def create(text, course=None, course_group=None):
+    """
+    Saves new broadcast
+
+    :param text: string
+    :param course: string or None for all courses
+    :param course_group: string or None for all groups
+    :return: int broadcast id
+    """
+    return db.execute("INSERT INTO broadcasts (text, course, course_group, status, sender, created_at) "
+                      "VALUES (?,?,?,'sending',?,?)", (text, course, course_group, uuid.uuid4().hex, int(time.time())))
+
+
+def get_unfinished():
+    """
+    Returns ids of broadcasts which were interrupted
+
+    :return: [int]
+    """
+    return [row[0] for row in db.fetchall("SELECT id FROM broadcasts WHERE status='interrupted' ORDER BY id")]
+
+
+def claim(broadcast_id):
+    """
+    Marks interrupted broadcast as being sent by the caller
+    Only one of concurrent callers gets it, so resumed broadcast has one sender
+
+    :param broadcast_id: int
+    :return: boolean, True if broadcast should be sent by the caller
+    """
+    sender = uuid.uuid4().hex
+    db.execute("UPDATE broadcasts SET status='sending', sender=? WHERE id=? AND status='interrupted'",
+               (sender, broadcast_id))
+    return db.fetchone("SELECT sender FROM broadcasts WHERE id=?", (broadcast_id,))[0] == sender
+
+
+def mark_interrupted():
+    """
+    Marks broadcasts which were being sent as interrupted
+    Called on bot start before any sender thread is started, so their senders were stopped by restart
+    """
+    db.execute("UPDATE broadcasts SET status='interrupted' WHERE status='sending'")
+
+
+def run(broadcast_id, send):
+    """
+    Sends broadcast to recipients not reached yet, saving progress after every batch
+    Broadcast must be created or claimed by the caller
+
+    :param broadcast_id: int
+    :param send: function(chat_id: int, text: string)
+    :return: {'sent': int, 'failed': int, 'blocked': int, 'throughput': float}
+    """
+    text, course, course_group, last_user_id, sent, failed, blocked = db.fetchone(
+        "SELECT text, course, course_group, last_user_id, sent, failed, blocked FROM broadcasts WHERE id=?",
+        (broadcast_id,))
+    started = time.monotonic()
+    sent_now = 0
+    try:
+        for user_ids in user_controller.iter_user_ids(course, course_group, after_id=last_user_id,
+                                                      batch_size=BROADCAST_BATCH_SIZE):
+            report = delivery.send_all(send, [(user_id, text) for user_id in user_ids])
+            sent += report['sent']
+            failed += report['failed']
+            blocked += report['blocked']
+            sent_now += report['sent']
+            db.execute("UPDATE broadcasts SET last_user_id=?, sent=?, failed=?, blocked=? WHERE id=?",
+                       (user_ids[-1], sent, failed, blocked, broadcast_id))
+    except Exception:
+        # progress is saved, so admin could resume it
+        db.execute("UPDATE broadcasts SET status='interrupted' WHERE id=?", (broadcast_id,))
+        raise
+    db.execute("UPDATE broadcasts SET status='done' WHERE id=?", (broadcast_id,))
+    seconds = time.monotonic() - started
+    return {'sent': sent, 'failed': failed, 'blocked': blocked,
+            'throughput': round(sent_now / seconds, 1) if seconds else 0}
@@ -0,0 +1,244 @@
+import calendar
+import hashlib
+import threading
+import zoneinfo
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules import lesson_controller
+from modules.lesson import format_time
+from settings import config
+from settings import strings
+
+"""
+iCalendar feeds of course groups timetables
+Every course group has its own feed url. Feed is rendered once per timetable version
+and repeated requests with the same ETag are answered with 304 Not Modified
+"""
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+feeds = {}  # {(timetable version, course, course_group): (etag, bytes)}, cleared when timetable is changed
+lesson_controller.on_timetable_change(feeds.clear)
+
+
+def get_token(course, course_group):
+    """
+    Returns token of course group used in feed url
+
+    :param course: string
+    :param course_group: string
+    :return: string
+    """
+    return hashlib.sha256(f"{course}\n{course_group}".encode()).hexdigest()[:16]
+
+
+# {token: (course, course_group)} of all registered course groups
+cohorts = {get_token(course, course_group): (course, course_group)
+           for course, course_groups in config.REGISTERED_COURSES.items() for course_group in course_groups}
+
+
+def get_url(course, course_group):
+    """
+    Returns public url of course group feed
+
+    :param course: string
+    :param course_group: string
+    :return: string
+    """
+    return f"{config.CALENDAR_BASE_URL}/calendar/{get_token(course, course_group)}.ics"
+
+
+def escape(text):
+    """
+    Escapes text value according to RFC 5545
+
+    :param text: string
+    :return: string
+    """
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+    """
+    Splits content line longer than 75 octets into continuation lines
+
+    :param line: string
+    :return: string
+    """
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts = []
+    while data:
+        size = min(len(data), 75 if not parts else 74)
+        # do not split multi-byte characters
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode())
+        data = data[size:]
+    return '\r\n '.join(parts)
+
+
+def get_first_monday():
+    """
+    Returns monday of the week recurring events start from
+
+    :return: date
+    """
+    if config.SEMESTER_FIRST_MONDAY:
+        return config.SEMESTER_FIRST_MONDAY
+    today = date.today()
+    return today - timedelta(days=today.weekday())
+
+
+def format_offset(offset):
+    """
+    :param offset: timedelta UTC offset
+    :return: string '+hhmm' or '-hhmm'
+    """
+    minutes = int(offset.total_seconds()) // 60
+    return f"{'-' if minutes < 0 else '+'}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}"
+
+
+def render_timezone(name, first):
+    """
+    Renders VTIMEZONE of the timezone which times of events are given in, clients do not have to know it.
+    Offset changes are searched in the year before first date and repeated every year,
+    so every event starting from the first date is inside some observance
+
+    :param name: string IANA timezone, e.g. 'Africa/Accra'
+    :param first: date
+    :return: [string] content lines
+    """
+    zone = zoneinfo.ZoneInfo(name)
+    start = datetime(first.year, first.month, first.day, tzinfo=timezone.utc)
+    offset = (start - timedelta(days=366)).astimezone(zone).utcoffset()
+    changes = []  # [(UTC moment, offset before, local time after)]
+    for day in range(-365, 1):
+        moment = start + timedelta(days=day)
+        if moment.astimezone(zone).utcoffset() != offset:
+            # offset changed during the previous day, the moment is found to a quarter of an hour
+            moment -= timedelta(days=1)
+            while moment.astimezone(zone).utcoffset() == offset:
+                moment += timedelta(minutes=15)
+            changes.append((moment, offset, moment.astimezone(zone)))
+            offset = moment.astimezone(zone).utcoffset()
+
+    lines = ['BEGIN:VTIMEZONE', f"TZID:{name}"]
+    if not changes:
+        local = start.astimezone(zone)
+        lines += ['BEGIN:STANDARD', 'DTSTART:19700101T000000', f"TZOFFSETFROM:{format_offset(local.utcoffset())}",
+                  f"TZOFFSETTO:{format_offset(local.utcoffset())}", f"TZNAME:{local.tzname()}", 'END:STANDARD']
+    kinds = set()
+    for moment, before, local in changes:
+        kind = 'DAYLIGHT' if local.dst() else 'STANDARD'
+        # the same yearly change could be found twice, the earlier one covers the later
+        if kind in kinds:
+            continue
+        kinds.add(kind)
+        # onset is given in local time before the change, e.g. the 2nd sunday or the last (-1) sunday of month
+        onset = moment + before
+        week = -1 if onset.day + 7 > calendar.monthrange(onset.year, onset.month)[1] else (onset.day - 1) // 7 + 1
+        lines += [f"BEGIN:{kind}", f"DTSTART:{onset.strftime('%Y%m%dT%H%M%S')}",
+                  f"RRULE:FREQ=YEARLY;BYMONTH={onset.month};BYDAY={week}{WEEKDAYS[onset.weekday()]}",
+                  f"TZOFFSETFROM:{format_offset(before)}", f"TZOFFSETTO:{format_offset(local.utcoffset())}",
+                  f"TZNAME:{local.tzname()}", f"END:{kind}"]
+    lines.append('END:VTIMEZONE')
+    return lines
+
+
+def render(course, course_group, timetable=None):
+    """
+    Renders weekly recurring events of all lessons of course group
+
+    :param course: string
+    :param course_group: string
+    :param timetable: lesson_controller.TimetableState, the current one by default
+    :return: bytes
+    """
+    if timetable is None:
+        timetable = lesson_controller.get_state()
+    monday = get_first_monday()
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//GTUC ScheduleBot//EN', 'CALSCALE:GREGORIAN',
+             fold(f"X-WR-CALNAME:{escape(f'{course} {course_group}')}"), f"X-WR-TIMEZONE:{config.CALENDAR_TIMEZONE}"]
+    # times of events refer to this definition by TZID
+    lines += render_timezone(config.CALENDAR_TIMEZONE, monday)
+    for day in range(len(strings.TEXT_DAYS_OF_WEEK)):
+        lesson_date = (monday + timedelta(days=day)).strftime('%Y%m%d')
+        for lesson in timetable.lessons.get((course, course_group, day), ()):
+            uid = hashlib.sha1(f"{course}\n{course_group}\n{day}\n{lesson.start}\n{lesson.subject}".encode())
+            lines += ['BEGIN:VEVENT',
+                      f"UID:{uid.hexdigest()}@schedulebot",
+                      f"DTSTAMP:{stamp}",
+                      f"DTSTART;TZID={config.CALENDAR_TIMEZONE}:{lesson_date}T{format_time(lesson.start).replace(':', '')}00",
+                      f"DTEND;TZID={config.CALENDAR_TIMEZONE}:{lesson_date}T{format_time(lesson.end).replace(':', '')}00",
+                      f"RRULE:FREQ=WEEKLY;BYDAY={WEEKDAYS[day]}",
+                      fold(f"SUMMARY:{escape(f'{lesson.subject} {lesson.type}'.strip())}"),
+                      fold(f"LOCATION:{escape(lesson.room)}"),
+                      fold(f"DESCRIPTION:{escape(lesson.teacher)}"),
+                      'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode()
+
+
+def get_feed(token):
+    """
+    Returns ETag and rendered feed of course group by its token or None if token is unknown
+
+    :param token: string
+    :return: (string, bytes) or None
+    """
+    cohort = cohorts.get(token)
+    if cohort is None:
+        return None
+    timetable = lesson_controller.get_state()
+    # feed rendered during reload is kept under the old version, so it is never sent with ETag of the new one
+    key = (timetable.version, *cohort)
+    feed = feeds.get(key)
+    if feed is None:
+        feed = feeds[key] = (f'"{timetable.version}-{token}"', render(*cohort, timetable))
+    return feed
+
+
+class CalendarRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /calendar/<token>.ics - feed of course group
+    """
+
+    def do_GET(self):
+        if not (self.path.startswith('/calendar/') and self.path.endswith('.ics')):
+            self.send_error(404)
+            return
+        feed = get_feed(self.path[len('/calendar/'):-len('.ics')])
+        if feed is None:
+            self.send_error(404)
+            return
+        etag, body = feed
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', f"max-age={config.CALENDAR_MAX_AGE_SECONDS}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # calendar clients poll often, their requests are not written to bot log
+        pass
+
+
+def start_server():
+    """
+    Starts calendar http server in background thread on CALENDAR_HOST:CALENDAR_PORT
+    """
+    server = ThreadingHTTPServer((config.CALENDAR_HOST, config.CALENDAR_PORT), CalendarRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from modules import db
+from settings.config import CONVERSATION_TTL_SECONDS
+
+"""
+Conversation state of chats: which step of multi-step dialog (e.g. /configure) chat is waiting for.
+State is stored in conversation_state table, one row per chat, and mirrored in memory.
+Only the process handling the chat changes its state, so memory copy stays actual
+"""
+
+steps = None  # {chat_id: (step, updated_at)}, loaded from database on first use
+lock = threading.Lock()
+
+
+def _load():
+    global steps
+    with lock:
+        if steps is None:
+            rows = db.fetchall("SELECT chat_id, step, updated_at FROM conversation_state WHERE updated_at>=?",
+                               (int(time.time()) - CONVERSATION_TTL_SECONDS,))
+            steps = {chat_id: (step, updated_at) for chat_id, step, updated_at in rows}
+
+
+def get_step(chat_id):
+    """
+    Returns name of step chat is waiting for or None
+    Steps older than CONVERSATION_TTL_SECONDS are considered abandoned
+
+    :param chat_id: int
+    :return: string or None
+    """
+    if steps is None:
+        _load()
+    state = steps.get(chat_id)
+    if state is None or state[1] < time.time() - CONVERSATION_TTL_SECONDS:
+        return None
+    return state[0]
+
+
+def set_step(chat_id, step):
+    """
+    Saves step chat is waiting for
+
+    :param chat_id: int
+    :param step: string
+    """
+    if steps is None:
+        _load()
+    updated_at = int(time.time())
+    db.execute("INSERT OR REPLACE INTO conversation_state (chat_id, step, updated_at) VALUES (?,?,?)",
+               (chat_id, step, updated_at))
+    steps[chat_id] = (step, updated_at)
+
+
+def clear(chat_id):
+    """
+    Finishes conversation of chat
+
+    :param chat_id: int
+    """
+    if steps is None:
+        _load()
+    if steps.pop(chat_id, None) is not None:
+        db.execute("DELETE FROM conversation_state WHERE chat_id=?", (chat_id,))
+
+
+def expire():
+    """
+    Deletes abandoned conversations from database and memory
+    """
+    expired = int(time.time()) - CONVERSATION_TTL_SECONDS
+    db.execute("DELETE FROM conversation_state WHERE updated_at<?", (expired,))
+    if steps is not None:
+        with lock:
+            for chat_id in [chat_id for chat_id, state in steps.items() if state[1] < expired]:
+                steps.pop(chat_id, None)
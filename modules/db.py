@@ -0,0 +1,219 @@
+import os
+import queue
+import sqlite3
+import threading
+
+from modules import metrics
+from settings.config import DB_FILE_NAME, DB_WRITE_BATCH_MAX, DB_WRITER_CHECK_SECONDS
+
+"""
+Data access layer shared by all controllers
+Every thread reads through its own sqlite connection, so readers do not wait for each other.
+Database works in WAL mode, so readers are not blocked by the writer.
+All writes go through one writer thread, which commits waiting writes together in one transaction
+"""
+
+local = threading.local()  # keeps connection of current thread
+writes = queue.Queue()  # writes waiting to be committed by writer thread
+writer_lock = threading.Lock()
+writer = None
+
+
+def connect():
+    """
+    Opens new connection to database with tuned pragmas
+
+    :return: sqlite3.Connection
+    """
+    # isolation_level=None disables implicit transactions, they are opened explicitly by writer
+    conn = sqlite3.connect(DB_FILE_NAME, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")  # readers are not blocked by writer
+    conn.execute("PRAGMA synchronous=NORMAL")  # in WAL mode fsync is needed only on checkpoint
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-8000")  # 8MB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def connection():
+    """
+    Returns connection of current thread, opens it if needed
+
+    :return: sqlite3.Connection
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = local.conn = connect()
+    return conn
+
+
+def fetchone(sql, params=()):
+    """
+    Executes read query and returns first row or None
+
+    :param sql: string
+    :param params: tuple
+    :return: tuple or None
+    """
+    _count_query('read')
+    return connection().execute(sql, params).fetchone()
+
+
+def fetchall(sql, params=()):
+    """
+    Executes read query and returns all rows
+
+    :param sql: string
+    :param params: tuple
+    :return: [tuple]
+    """
+    _count_query('read')
+    return connection().execute(sql, params).fetchall()
+
+
+def get_query_count():
+    """
+    Returns number of queries made by current thread since its start
+    Used for measuring queries made by one handler
+
+    :return: int
+    """
+    return getattr(local, 'queries', 0)
+
+
+def _count_query(kind):
+    local.queries = getattr(local, 'queries', 0) + 1
+    metrics.inc('db_queries_total', kind=kind)
+
+
+class Write:
+    """
+    Write query waiting in the queue for commit
+    """
+    __slots__ = ('sql', 'params', 'many', 'done', 'error', 'lastrowid')
+
+    def __init__(self, sql, params, many):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.done = threading.Event()
+        self.error = None
+        self.lastrowid = None
+
+
+def execute(sql, params=()):
+    """
+    Executes write query and waits until it is committed
+    Writes of concurrent threads are committed together
+
+    :param sql: string
+    :param params: tuple
+    :return: int id of inserted row
+    """
+    write = Write(sql, params, False)
+    _write(write)
+    return write.lastrowid
+
+
+def executemany(sql, seq_of_params):
+    """
+    Executes write query for every params tuple and waits until they are committed
+
+    :param sql: string
+    :param seq_of_params: [tuple]
+    """
+    _write(Write(sql, list(seq_of_params), True))
+
+
+def _write(write):
+    _count_query('write')
+    writer_thread = _start_writer()
+    with metrics.timed('db_write_wait_seconds'):
+        writes.put(write)
+        # writer catches its errors, but if it still dies the write would never be done
+        while not write.done.wait(DB_WRITER_CHECK_SECONDS):
+            if not writer_thread.is_alive():
+                _forget_writer(writer_thread)
+                raise sqlite3.OperationalError("database writer thread stopped")
+    if write.error:
+        raise write.error
+
+
+def _start_writer():
+    """
+    Starts writer thread if it is not running
+
+    :return: threading.Thread
+    """
+    global writer
+    with writer_lock:
+        if writer is None or not writer.is_alive():
+            writer = threading.Thread(target=_write_batches, daemon=True)
+            writer.start()
+        return writer
+
+
+def _forget_writer(writer_thread):
+    global writer
+    with writer_lock:
+        if writer is writer_thread:
+            writer = None
+
+
+def _write_batches():
+    """
+    Runs in the writer thread. Takes all waiting writes and commits them in one transaction
+    Each write is isolated by savepoint, so failed write does not affect others.
+    If the whole transaction fails, e.g. database stays locked by another process longer than busy_timeout,
+    all writes of the batch get the error and the thread goes on with the next batch
+    """
+    conn = connect()
+    while 1:
+        batch = [writes.get()]
+        while len(batch) < DB_WRITE_BATCH_MAX:
+            try:
+                batch.append(writes.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for write in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    if write.many:
+                        conn.executemany(write.sql, write.params)
+                    else:
+                        write.lastrowid = conn.execute(write.sql, write.params).lastrowid
+                    conn.execute("RELEASE write")
+                except Exception as error:
+                    write.error = error
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+        except Exception as error:
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                # connection is broken, the next batch uses new one
+                conn = connect()
+            for write in batch:
+                write.error = write.error or error
+        finally:
+            for write in batch:
+                write.done.set()
+
+
+def _reset_after_fork():
+    """
+    Connections and writer thread of parent process can not be used in forked child,
+    child opens its own ones
+    """
+    global local, writes, writer_lock, writer
+    local = threading.local()
+    writes = queue.Queue()
+    writer_lock = threading.Lock()
+    writer = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
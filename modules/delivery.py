@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules import metrics
+from modules import user_controller
+from settings import config
+
+"""
+Delivery module sends bulk messages (e.g. reminders) through telegram
+Messages are sent by pool of workers, limited by telegram rate limits
+and retried if telegram asks to wait
+"""
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket. Allows `rate` acquires per second
+    with bursts up to `capacity`. Could be paused, e.g. when telegram asks to wait
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate: float
+        :param capacity: int
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, sleeps until token is available if needed
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops giving tokens to all threads for given time
+
+        :param seconds: float
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # tokens are not collected during pause, so sending does not burst right after it
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+class ChatLimiter:
+    """
+    Keeps minimal interval between two messages sent to the same chat
+    Slots which already passed are forgotten, so chats messaged long ago do not take memory
+    """
+
+    def __init__(self, interval):
+        """
+        :param interval: float seconds
+        """
+        self.interval = interval
+        self.next_allowed = {}  # {chat_id: monotonic time of the next free slot}
+        self.prune_size = 1024  # number of chats when passed slots are dropped
+        self.lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        """
+        Reserves next free slot for chat and sleeps until it comes
+
+        :param chat_id: int
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed.get(chat_id, now))
+            self.next_allowed[chat_id] = slot + self.interval
+            if len(self.next_allowed) >= self.prune_size:
+                self.next_allowed = {chat: allowed for chat, allowed in self.next_allowed.items() if allowed > now}
+                # the limit grows with number of active chats, so dropping stays rare
+                self.prune_size = max(1024, 2 * len(self.next_allowed))
+        if slot > now:
+            time.sleep(slot - now)
+
+
+global_limiter = TokenBucket(config.SEND_RATE_GLOBAL, config.SEND_RATE_GLOBAL)
+chat_limiter = ChatLimiter(config.SEND_INTERVAL_PER_CHAT)
+
+
+def get_status_code(exception):
+    """
+    Returns http status code of failed telegram request or None
+
+    :param exception: Exception
+    :return: int or None
+    """
+    if hasattr(exception, 'error_code'):
+        return exception.error_code
+    if hasattr(exception, 'result') and hasattr(exception.result, 'status_code'):
+        return exception.result.status_code
+
+
+def get_retry_after(exception):
+    """
+    Returns amount of seconds telegram asked to wait before next request
+
+    :param exception: Exception
+    :return: int
+    """
+    result_json = getattr(exception, 'result_json', None) or {}
+    return result_json.get('parameters', {}).get('retry_after', 1)
+
+
+def percentile(values, percent):
+    """
+    Returns percentile of sorted list by nearest rank
+
+    :param values: [float] sorted
+    :param percent: int [0-100]
+    :return: float
+    """
+    if not values:
+        return 0
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def send_all(send, messages):
+    """
+    Sends all messages concurrently and waits until everything is delivered
+    Users that blocked the bot are deleted from database in one batch
+
+    :param send: function(chat_id: int, text: string), e.g. wrapped bot.send_message
+    :param messages: [(int, string)] chat ids and texts
+    :return: {'sent': int, 'failed': int, 'blocked': int, 'p50': float, 'p95': float, 'p99': float}
+    """
+    started = time.monotonic()
+    latencies = []
+    failed = []
+    blocked = []
+    results_lock = threading.Lock()
+
+    def deliver(chat_id, text):
+        for _ in range(config.SEND_MAX_RETRIES + 1):
+            global_limiter.acquire()
+            chat_limiter.acquire(chat_id)
+            try:
+                send(chat_id, text)
+            except Exception as exception:
+                status_code = get_status_code(exception)
+                # 429 Too Many Requests means wait for retry_after seconds and try again,
+                # other workers wait too, otherwise they would spend their retries on the same limit
+                if status_code == 429:
+                    global_limiter.pause(get_retry_after(exception))
+                    continue
+                with results_lock:
+                    # 403 Forbidden means user blocked the bot
+                    (blocked if status_code == 403 else failed).append(chat_id)
+                return
+            with results_lock:
+                latencies.append(time.monotonic() - started)
+            return
+        with results_lock:
+            failed.append(chat_id)
+
+    with ThreadPoolExecutor(max_workers=config.SEND_WORKERS) as executor:
+        for chat_id, text in messages:
+            executor.submit(deliver, chat_id, text)
+
+    if blocked:
+        user_controller.delete_many(blocked)
+
+    latencies.sort()
+    metrics.inc('messages_sent_total', len(latencies), result='sent')
+    metrics.inc('messages_sent_total', len(failed), result='failed')
+    metrics.inc('messages_sent_total', len(blocked), result='blocked')
+    report = {'sent': len(latencies), 'failed': len(failed), 'blocked': len(blocked),
+              'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99)}
+    logging.getLogger(config.LOGGER_NAME).info(
+        f"DELIVERY sent {report['sent']} :: failed {report['failed']} :: blocked {report['blocked']} :: "
+        f"p50 {report['p50']:.2f}s :: p95 {report['p95']:.2f}s :: p99 {report['p99']:.2f}s")
+    return report
@@ -1,5 +1,38 @@
 from datetime import datetime
-import time
+
+
+def minutes_since_midnight(moment=None):
+    """
+    Converts moment of the day to number of minutes since midnight
+    Used as "now" snapshot for comparing with lesson times
+
+    :param moment: datetime, current time by default
+    :return: float
+    """
+    if moment is None:
+        moment = datetime.now()
+    return moment.hour * 60 + moment.minute + moment.second / 60
+
+
+def parse_time(value):
+    """
+    Converts time stored in database to number of minutes since midnight
+
+    :param value: string 'hh:mm' or 'h:mm'
+    :return: int
+    """
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def format_time(minutes):
+    """
+    Converts number of minutes since midnight to 'hh:mm' string
+
+    :param minutes: int
+    :return: string
+    """
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
 
 
 class Lesson:
@@ -7,8 +40,15 @@ class Lesson:
     """
     Class allows simple transmission of lessons
     between lesson_controller and other modules
+
+    Lesson does not depend on current time and is not changed after creation,
+    so the same objects are shared by all users from timetable index
     """
 
+    TYPES = ('Lec', 'Tut', 'Lab', '')  # printed after subject name, stored in database as index
+
+    __slots__ = ('subject', 'type', 'teacher', 'teacher_gender', 'start', 'end', 'room', 'text')
+
     def __init__(self, arg):
         """
         Constructor receives raw tuple from database
@@ -22,35 +62,36 @@ class Lesson:
                      room: int)
         """
         self.subject = arg[0]
-        self.type = ('Lec', 'Tut', 'Lab', '')[arg[1]]  # printed after subject name
+        self.type = self.TYPES[arg[1]]
         self.teacher = arg[2]
         self.teacher_gender = arg[3]
-        # time is stored as string in database and needs to be converted to datetime for comparing
-        start_time = time.strptime(arg[4], "%H:%M")
-        end_time = time.strptime(arg[5], "%H:%M")
-        self.start = datetime.now().replace(hour=start_time.tm_hour, minute=start_time.tm_min)
-        self.end = datetime.now().replace(hour=end_time.tm_hour, minute=end_time.tm_min)
+        # time is stored as string in database and is converted once to minutes since midnight for comparing
+        self.start = parse_time(arg[4])
+        self.end = parse_time(arg[5])
         self.room = arg[6]
+        # lesson is printed many times, so string is made once
+        self.text = f"{self.subject} {self.type}\n"\
+                    f"{'👨' if self.teacher_gender else '👩'} {self.teacher}\n"\
+                    f"🕐 {format_time(self.start)} 	— {format_time(self.end)}\n" \
+                    f"🚪{self.room}\n"
 
-    @property
-    def minutes_until_start(self):
+    def minutes_until_start(self, now):
         """
         Total number of minutes until lesson begins
 
+        :param now: float minutes since midnight, see minutes_since_midnight
         :return: int
         """
-        seconds_left = (self.start - datetime.now()).total_seconds()
-        return round(seconds_left / 60)
+        return round(self.start - now)
 
-    @property
-    def minutes_until_end(self):
+    def minutes_until_end(self, now):
         """
         Total number of minutes until lesson ends
 
+        :param now: float minutes since midnight, see minutes_since_midnight
         :return: int
         """
-        seconds_left = (self.end - datetime.now()).total_seconds()
-        return round(seconds_left / 60)
+        return round(self.end - now)
 
     def __lt__(self, other):
         """
@@ -68,30 +109,30 @@ class Lesson:
 
         :return: String
         """
+        return self.text
 
-        return f"{self.subject} {self.type}\n"\
-               f"{'👨' if self.teacher_gender else '👩'} {self.teacher}\n"\
-               f"🕐 {datetime.strftime(self.start, '%H:%M')} 	— {datetime.strftime(self.end, '%H:%M')}\n" \
-               f"🚪{self.room}\n"
-
-    def get_str_current(self):
+    def get_str_current(self, now):
         """
         Returns string for the amount of time left for ongoing lesson.
         Used when NOW button is pressed and lesson is ongoing.
 
+        :param now: float minutes since midnight, see minutes_since_midnight
         :return: String
         """
-        hours_until_end = self.minutes_until_end // 60
-        return f"{self}⏸️ {str(hours_until_end)+'h ' if hours_until_end > 0 else ''}" \
-               f"{self.minutes_until_end % 60}m\n"
+        minutes_until_end = self.minutes_until_end(now)
+        hours_until_end = minutes_until_end // 60
+        return f"{self.text}⏸️ {str(hours_until_end)+'h ' if hours_until_end > 0 else ''}" \
+               f"{minutes_until_end % 60}m\n"
 
-    def get_str_future(self):
+    def get_str_future(self, now):
         """
         Returns string for amount of time left for future lesson
         Used when NOW button is pressed and there's an upcoming lesson
 
+        :param now: float minutes since midnight, see minutes_since_midnight
         :return: String
         """
-        hours_until_start = self.minutes_until_start // 60
-        return f"{self}▶ ️{str(hours_until_start)+'h ' if hours_until_start > 0 else ''}" \
-               f"{self.minutes_until_start % 60}m\n"
+        minutes_until_start = self.minutes_until_start(now)
+        hours_until_start = minutes_until_start // 60
+        return f"{self.text}▶ ️{str(hours_until_start)+'h ' if hours_until_start > 0 else ''}" \
+               f"{minutes_until_start % 60}m\n"
@@ -1,106 +1,301 @@
-from datetime import datetime, timedelta
-import sqlite3
-import threading
+from datetime import date, datetime, timedelta
+import logging
+import time
 
+from modules import db
+from modules import overrides
 from modules import user_controller
-from modules.lesson import Lesson
-from settings.config import REMIND_WHEN_LEFT_MINUTES
+from modules.lesson import Lesson, minutes_since_midnight, parse_time
+from settings.config import LOGGER_NAME, REGISTERED_COURSES, REMIND_LEAD_OPTIONS, TIMETABLE_CHECK_SECONDS
 
-conn = sqlite3.connect('db.sqlite', check_same_thread=False)  # open new sqlite connection
-cursor = conn.cursor()  # cursor allows to iterate over database data
-lock = threading.RLock()  # at any moment of time only one thread may request db. All others are waiting
 
+class TimetableState:
+    """
+    In-memory timetable index with overrides and caches derived from them
+    Built from database on first use and swapped as a whole on reload, so lookups never touch sqlite.
+    Caches belong to the state they are calculated from, so lessons of old timetable never get into new caches
+    """
 
-def get_day_lessons(user_id, day):
+    __slots__ = ('version', 'lessons', 'overrides', 'effective', 'starting')
+
+    def __init__(self, version, lessons, index_overrides):
+        """
+        :param version: int version from meta table the state was built from
+        :param lessons: {(course, course_group, day): (Lesson)} sorted lessons of every weekday
+        :param index_overrides: {(course, course_group or None): IntervalIndex} see overrides module
+        """
+        self.version = version
+        self.lessons = lessons
+        self.overrides = index_overrides
+        self.effective = {}  # {(course, course_group, date): (Lesson)} merged lessons of dates having overrides
+        self.starting = {}  # {date: {start minute: [(course, course_group, Lesson)]}} for reminders
+
+
+state = None  # current TimetableState
+timetable_listeners = []  # functions called after every timetable reload
+
+
+def get_stored_version():
     """
-    Function return lessons for user on exact weekday sorted by start time
+    Returns timetable version stored in database, it is increased by every timetable import
 
-    :param user_id:  int
-    :param day:  int [0-6]
-    :return: [Lesson]
+    :return: int
+    """
+    data = db.fetchone("SELECT value FROM meta WHERE key='timetable_version'")
+    return data[0] if data else 0
+
+
+def reload_timetable():
+    """
+    Rebuilds timetable index from common_lessons and group_lessons tables
+    Should be called every time lessons in database are changed
+    """
+    # version is read first, so timetable changed during reload is reloaded again
+    version = get_stored_version()
+    columns = "subject, type, teacher, teacher_gender, start, end, room"
+    common = db.fetchall(f"SELECT course, day, {columns} FROM common_lessons")
+    group = db.fetchall(f"SELECT course, lesson_group, day, {columns} FROM group_lessons")
+    index_overrides = overrides.load()
+
+    # common lessons belong to every group of the course, so collect all known groups
+    groups = {}
+    for course, course_groups in REGISTERED_COURSES.items():
+        groups.setdefault(course, set()).update(course_groups)
+    for row in group:
+        groups.setdefault(row[0], set()).add(row[1])
+
+    index = {}
+    for row in common:
+        lesson = Lesson(row[2:])  # the same lesson object is shared by all groups of the course
+        for course_group in groups.get(row[0], ()):
+            index.setdefault((row[0], course_group, row[1]), []).append(lesson)
+    for row in group:
+        index.setdefault((row[0], row[1], row[2]), []).append(Lesson(row[3:]))
+
+    global state
+    state = TimetableState(version, {key: tuple(sorted(lessons)) for key, lessons in index.items()}, index_overrides)
+    for listener in timetable_listeners:
+        listener()
+
+
+def get_state():
+    """
+    Returns current timetable state, loads it if needed
+    Lessons and overrides of the state are never changed, so it could be used for several lookups
+
+    :return: TimetableState
+    """
+    current = state
+    if current is None:
+        reload_timetable()
+        current = state
+    return current
+
+
+def on_timetable_change(callback):
+    """
+    Registers function to be called every time timetable is reloaded
+
+    :param callback: function
     """
+    timetable_listeners.append(callback)
 
-    with lock:
-        user = user_controller.get(user_id)
-        if not user:
-            return
 
-        columns = "subject, type, teacher, teacher_gender, start, end, room"
+def refresh_if_changed():
+    """
+    Reloads timetable if it was changed in database since the last reload, e.g. by timetable_import
 
-        # Take lessons that are common for whole course
-        cursor.execute(f"SELECT {columns} FROM common_lessons "
-                       "WHERE course=? AND day=?", (user.course, day,))
-        data = cursor.fetchall()
+    :return: boolean True if timetable was reloaded
+    """
+    if state is not None and get_stored_version() == state.version:
+        return False
+    reload_timetable()
+    return True
 
-        # Take lessons that are only for user`s course group
-        cursor.execute(f"SELECT {columns} FROM group_lessons "
-                       "WHERE course=? AND lesson_group=? AND day=?", (user.course, user.course_group, day,))
-        data += cursor.fetchall()
 
-    return sorted([Lesson(x) for x in data])
+def watch_timetable():
+    """
+    Runs in background thread and reloads timetable every time it is changed in database
+    """
+    while 1:
+        time.sleep(TIMETABLE_CHECK_SECONDS)
+        try:
+            if refresh_if_changed():
+                logging.getLogger(LOGGER_NAME).info(f"TIMETABLE reloaded version {state.version}")
+        except Exception as exception:
+            logging.getLogger(LOGGER_NAME).exception(f"TIMETABLE reload failed: {exception}")
 
 
-def get_current_lesson(user_id):
+def get_cohort_lessons(course, course_group, day):
+    """
+    Function returns lessons for course group on exact weekday sorted by start time
+    Result is taken from timetable index and must not be changed
+
+    :param course: string
+    :param course_group: string
+    :param day: int [0-6]
+    :return: (Lesson)
+    """
+    return get_state().lessons.get((course, course_group, day), ())
+
+
+def get_effective_lessons(course, course_group, moment, current=None):
+    """
+    Function returns lessons for course group on exact date sorted by start time:
+    lessons of its weekday with overrides of the date applied
+    Result must not be changed
+
+    :param course: string
+    :param course_group: string
+    :param moment: date
+    :param current: TimetableState lessons are taken from, the current one by default
+    :return: (Lesson)
+    """
+    if current is None:
+        current = get_state()
+    lessons = current.lessons.get((course, course_group, moment.weekday()), ())
+    if not current.overrides:
+        return lessons
+    key = (course, course_group, moment)
+    merged = current.effective.get(key)
+    if merged is None:
+        active = overrides.get_active(current.overrides, course, course_group, moment)
+        if not active:
+            return lessons
+        merged = current.effective[key] = overrides.merge(lessons, active)
+    return merged
+
+
+def get_upcoming_date(day):
+    """
+    Returns the nearest date of weekday, today for today's weekday
+
+    :param day: int [0-6]
+    :return: date
+    """
+    today = date.today()
+    return today + timedelta(days=(day - today.weekday()) % 7)
+
+
+def get_day_lessons(user_id, day):
+    """
+    Function return lessons for user on the nearest date of exact weekday sorted by start time
+
+    :param user_id:  int
+    :param day:  int [0-6]
+    :return: [Lesson]
+    """
+    user = user_controller.get(user_id)
+    if not user:
+        return
+
+    return list(get_effective_lessons(user.course, user.course_group, get_upcoming_date(day)))
+
+
+def get_current_lesson(user_id, now=None):
     """
     Function returns Lesson for user's current lesson
     or None if there is no such lesson
 
     :param user_id: int
+    :param now: float minutes since midnight, current time by default
     :return: Lesson or None
     """
+    if now is None:
+        now = minutes_since_midnight()
     today_lessons = get_day_lessons(user_id, datetime.today().weekday())
     for lesson in today_lessons:
-        if lesson.start < datetime.now() < lesson.end:
+        if lesson.start <= now < lesson.end:
             return lesson
 
 
-def get_next_lesson(user_id):
+def get_next_lesson(user_id, now=None):
     """
     Function returns next lesson for specified user
     or None if there is no such lesson
 
     :param user_id: int
+    :param now: float minutes since midnight, current time by default
     :return: Lesson or None
     """
+    if now is None:
+        now = minutes_since_midnight()
     today_lessons = get_day_lessons(user_id, datetime.today().weekday())
     for lesson in today_lessons:
-        if datetime.now() < lesson.start:
+        if now < lesson.start:
             return lesson
 
 
-def get_relevant_reminders():
+def get_starting_lessons(moment):
+    """
+    Returns lessons of all course groups on exact date grouped by start minute
+    Result is calculated once per date and must not be changed
+
+    :param moment: date
+    :return: {start minute: [(course, course_group, Lesson)]}
     """
-    Function is called in fixed amount of minutes before each lesson (e.g. 10 minutes)
+    current = get_state()
+    starting = current.starting.get(moment)
+    if starting is None:
+        # groups without weekly lessons on this weekday could have added ones
+        cohorts = {(course, course_group) for course, course_groups in REGISTERED_COURSES.items()
+                   for course_group in course_groups}
+        cohorts.update((course, course_group) for course, course_group, day in current.lessons
+                       if day == moment.weekday())
+        starting = {}
+        for course, course_group in cohorts:
+            for lesson in get_effective_lessons(course, course_group, moment, current):
+                starting.setdefault(lesson.start, []).append((course, course_group, lesson))
+        # dates of the past are not needed anymore
+        for old in [old for old in current.starting if old < moment - timedelta(days=1)]:
+            current.starting.pop(old, None)
+        current.starting[moment] = starting
+    return starting
+
+
+def get_relevant_reminders(at=None):
+    """
+    Function is called before each lesson at every lead time users can choose (e.g. 10 minutes)
     Returns list of tuples with user ids and lessons.
     Each user in tuple must be reminded about his lesson
 
+    Only subscribers of course groups having lesson exactly in their lead time after remind time are read,
+    with one query grouped by course group and lead time, so lessons are shared between users of the group
+
+    :param at: datetime of remind, current minute by default
     :return: [(int, Lesson)]
     """
-    users = user_controller.get_users_with_reminders()
+    if at is None:
+        at = datetime.now().replace(second=0, microsecond=0)
+    buckets = {}  # {(course, course_group, remind_lead): [Lesson]}
+    for remind_lead in REMIND_LEAD_OPTIONS:
+        start = at + timedelta(minutes=remind_lead)
+        for course, course_group, lesson in get_starting_lessons(start.date()).get(start.hour * 60 + start.minute, ()):
+            buckets.setdefault((course, course_group, remind_lead), []).append(lesson)
+    if not buckets:
+        return []
     need_remind = []
-    for user in users:
-        if not user_controller.is_configured(user.id):
-            continue
-        next_lesson = get_next_lesson(user.id)
-        if next_lesson and abs(next_lesson.minutes_until_start - REMIND_WHEN_LEFT_MINUTES) <= 1:
-            need_remind.append((user.id, next_lesson))
+    for bucket, user_ids in user_controller.get_reminder_cohorts(list(buckets)).items():
+        for lesson in buckets[bucket]:
+            need_remind.extend((user_id, lesson) for user_id in user_ids)
     return need_remind
 
 
-def get_reminder_times():
+def get_start_times(moment):
     """
-    Function is called once when reminder module is started
-    Return array of times in 'hh:mm' format, when reminders should be sent every day
+    Returns all distinct lesson start times of all course groups on exact date
+    Start times of cancelled lessons are kept, they just have nobody to remind
 
-    :return: [String]
+    :param moment: date
+    :return: [(hour: int, minute: int)] sorted
     """
-    with lock:
-        cursor.execute("SELECT start FROM group_lessons GROUP BY start UNION "
-                       "SELECT start FROM common_lessons GROUP BY start")
-        data = cursor.fetchall()
-    # each row is array with one element - start time
-    data = sorted([row[0] for row in data])
-    # subtract needed time from lesson start time for making remind in time
-    data = [datetime.strptime(start_time, "%H:%M") - timedelta(minutes=REMIND_WHEN_LEFT_MINUTES) for start_time in data]
-    # convert datetime back to string
-    return [remind_time.strftime("%H:%M") for remind_time in data]
+    current = get_state()
+    day = moment.weekday()
+    starts = {lesson.start for (_, _, lesson_day), lessons in current.lessons.items() if lesson_day == day
+              for lesson in lessons}
+    # moved and added lessons start at new times
+    point = moment.toordinal()
+    for interval_index in current.overrides.values():
+        starts.update(parse_time(override.new_start) for override in interval_index.get(point)
+                      if override.new_start and override.matches(moment))
+    return sorted(divmod(start, 60) for start in starts)
@@ -0,0 +1,165 @@
+import bisect
+import re
+from datetime import datetime
+
+from modules import lesson_controller
+from modules.lesson import minutes_since_midnight
+from settings.config import SEARCH_MAX_PREFIX, SEARCH_RESULTS
+
+"""
+Search of lessons by subject, teacher and room used by inline queries
+Every word of lesson is indexed by all its prefixes, so lookup is a single dict access.
+Postings are ordered by time of the week, so lessons are ranked by next occurrence
+without sorting: search starts from the current minute and wraps around the week
+"""
+
+WORD = re.compile(r'\w+')
+
+
+class SearchIndex:
+
+    """
+    Immutable prefix index of all lessons of the timetable
+    """
+
+    __slots__ = ('entries', 'times', 'words', 'postings')
+
+    def __init__(self, timetable):
+        """
+        :param timetable: {(course, course_group, day): (Lesson)} see lesson_controller.TimetableState
+        """
+        # common lessons are shared by all groups of the course, they are indexed once with course_group None
+        groups = {}
+        for (course, course_group, day), lessons in timetable.items():
+            for lesson in lessons:
+                groups.setdefault((course, day, id(lesson)), (lesson, []))[1].append(course_group)
+        entries = []
+        for (course, day, _), (lesson, course_groups) in groups.items():
+            entries.append((day * 24 * 60 + lesson.start, course, course_groups[0] if len(course_groups) == 1 else None,
+                            day, lesson))
+        entries.sort(key=lambda entry: entry[0])
+        self.entries = [entry[1:] for entry in entries]  # [(course, course_group or None, day, Lesson)]
+        self.times = [entry[0] for entry in entries]  # minute of the week every entry starts at
+        self.words = [get_words(f"{entry[4].subject} {entry[4].teacher} {entry[4].room}") for entry in entries]
+        postings = {}
+        for number, words in enumerate(self.words):
+            for prefix in {word[:size] for word in words for size in range(1, min(len(word), SEARCH_MAX_PREFIX) + 1)}:
+                postings.setdefault(prefix, []).append(number)
+        # entry numbers in every posting are ascending, i.e. ordered by time of the week
+        self.postings = {prefix: tuple(numbers) for prefix, numbers in postings.items()}
+
+    def search(self, query, week_minute, limit=SEARCH_RESULTS, accept=None):
+        """
+        Returns entries matching every word of query ordered by next occurrence after week_minute
+
+        :param query: string
+        :param week_minute: int minutes since monday midnight
+        :param limit: int
+        :param accept: function(entry) -> boolean, additional filter of entries
+        :return: [(course, course_group or None, day: int, Lesson)]
+        """
+        words = get_words(query)
+        if not words:
+            return []
+        # the shortest posting is iterated, other words are checked against words of the entry
+        posting = min((self.postings.get(word[:SEARCH_MAX_PREFIX], ()) for word in words), key=len)
+        position = bisect.bisect_left(posting, bisect.bisect_left(self.times, week_minute))
+        found = []
+        for i in range(position, position + len(posting)):
+            number = posting[i % len(posting)]
+            if all(any(own.startswith(word) for own in self.words[number]) for word in words):
+                entry = self.entries[number]
+                if accept is None or accept(entry):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+def get_words(text):
+    """
+    Splits text to lowercase words
+
+    :param text: string
+    :return: (string)
+    """
+    return tuple(WORD.findall(str(text).lower()))
+
+
+index = None  # (TimetableState, SearchIndex of its lessons), built on first search after every reload
+cohort_indexes = (None, {})  # (TimetableState, {(course, course_group): SearchIndex of lessons of the group})
+
+
+def forget():
+    """
+    Drops index, called when timetable is changed
+    """
+    global index, cohort_indexes
+    index = None
+    cohort_indexes = (None, {})
+
+
+lesson_controller.on_timetable_change(forget)
+
+
+def get_index():
+    """
+    Returns index of the current timetable, builds it if needed
+
+    :return: SearchIndex
+    """
+    global index
+    timetable = lesson_controller.get_state()
+    current = index
+    # index built from the old timetable during reload is not used
+    if current is None or current[0] is not timetable:
+        current = index = (timetable, SearchIndex(timetable.lessons))
+    return current[1]
+
+
+def get_cohort_index(course, course_group):
+    """
+    Returns index of lessons of course group in the current timetable, builds it on the first search of the group
+
+    :param course: string
+    :param course_group: string
+    :return: SearchIndex
+    """
+    global cohort_indexes
+    timetable = lesson_controller.get_state()
+    current = cohort_indexes
+    if current[0] is not timetable:
+        current = cohort_indexes = (timetable, {})
+    cohort_index = current[1].get((course, course_group))
+    if cohort_index is None:
+        cohort_index = current[1][(course, course_group)] = SearchIndex(
+            {key: lessons for key, lessons in timetable.lessons.items() if key[:2] == (course, course_group)})
+    return cohort_index
+
+
+def search(query, course=None, course_group=None, moment=None, limit=SEARCH_RESULTS):
+    """
+    Finds lessons by subject, teacher and room
+    Lessons of the given course group go first, then lessons of all other groups,
+    both ordered by the next occurrence
+
+    :param query: string
+    :param course: string course of user or None
+    :param course_group: string course group of user or None
+    :param moment: datetime, current time by default
+    :param limit: int
+    :return: [(course, course_group or None, day: int, Lesson)]
+    """
+    if moment is None:
+        moment = datetime.now()
+    week_minute = moment.weekday() * 24 * 60 + int(minutes_since_midnight(moment))
+    current = get_index()
+    if course is None:
+        return current.search(query, week_minute, limit)
+
+    # lessons of the group have own index, so they are not filtered out of the whole one
+    found = get_cohort_index(course, course_group).search(query, week_minute, limit)
+    if len(found) < limit:
+        found += current.search(query, week_minute, limit - len(found),
+                                lambda entry: not (entry[0] == course and entry[1] in (course_group, None)))
+    return found
@@ -0,0 +1,154 @@
+import atexit
+import copy
+import functools
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from modules import db
+from modules import metrics
+from settings import config
+
+"""
+Logging pipeline
+Handlers only put log records to queue, records are written to file by background listener thread.
+Queue is shared with forked sharding workers, so the main process is the only writer of the log file.
+Every record is one JSON line, rotated files are compressed with gzip
+"""
+
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats record as one JSON line with all extra fields given to logger
+    """
+    FIELDS = ('handler', 'user_id', 'alias', 'text', 'latency_ms', 'db_queries')
+
+    def format(self, record):
+        entry = {'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                 'level': record.levelname,
+                 'message': record.getMessage()}
+        for field in self.FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # traceback of queued record is already formatted, see RecordQueueHandler
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Puts records to queue keeping traceback in exc_text,
+    QueueHandler would append it to message and JsonFormatter could not write it as separate field
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # arguments and traceback could not be pickled, so they are formatted here
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only LOG_MESSAGE_SAMPLE_RATE part of user message records, other records are always kept
+    """
+
+    def filter(self, record):
+        return not hasattr(record, 'handler') or random.random() < config.LOG_MESSAGE_SAMPLE_RATE
+
+
+def compress(source, destination):
+    """
+    Rotator of log files: compresses rotated file instead of renaming
+
+    :param source: string
+    :param destination: string
+    """
+    with open(source, 'rb') as f_in, gzip.open(destination, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def make_file_handler():
+    """
+    Creates file handler rotated by time if LOG_ROTATE_WHEN is set, otherwise by size
+
+    :return: logging.Handler
+    """
+    if config.LOG_ROTATE_WHEN:
+        handler = TimedRotatingFileHandler(config.LOG_FILE_NAME, when=config.LOG_ROTATE_WHEN,
+                                           backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        handler = RotatingFileHandler(config.LOG_FILE_NAME, maxBytes=config.LOG_MAX_SIZE_BYTES,
+                                      backupCount=config.LOG_BACKUP_COUNT, encoding='utf-8')
+    handler.rotator = compress
+    handler.namer = lambda name: name + '.gz'
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def configure_logging():
+    """
+    Attaches queue to bot logger and starts writing queued records to file in background
+    """
+    global listener
+    logger = logging.getLogger(config.LOGGER_NAME)
+    logger.setLevel(logging.INFO)
+    # forked workers inherit the queue and the handler, their records are written by this listener
+    records = multiprocessing.get_context('fork').Queue()
+    queue_handler = RecordQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(queue_handler)
+    listener = QueueListener(records, make_file_handler())
+    listener.start()
+    # write records left in queue on exit
+    atexit.register(listener.stop)
+
+
+def logged_handler(function):
+    """
+    Decorator for message and inline query handlers. Logs every message with handler name, user,
+    time spent in handler and number of database queries it made, and adds them to metrics
+
+    :param function: function(message or inline query)
+    :return: function(message or inline query)
+    """
+    logger = logging.getLogger(config.LOGGER_NAME)
+
+    @functools.wraps(function)
+    def wrapper(message):
+        started = time.perf_counter()
+        queries = db.get_query_count()
+        try:
+            return function(message)
+        finally:
+            latency = time.perf_counter() - started
+            queries = db.get_query_count() - queries
+            metrics.observe('handler_latency_seconds', latency, handler=function.__name__)
+            metrics.observe('handler_db_queries', queries, handler=function.__name__)
+            logger.info(function.__name__, extra={
+                'handler': function.__name__,
+                'user_id': message.from_user.id,
+                'alias': message.from_user.username,
+                # inline queries have query instead of text
+                'text': getattr(message, 'text', None) or getattr(message, 'query', None) or '--not_text--',
+                'latency_ms': round(latency * 1000, 2),
+                'db_queries': queries})
+
+    return wrapper
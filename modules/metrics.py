@@ -0,0 +1,302 @@
+import collections
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from settings import config
+
+"""
+Metrics of the bot: counters and latency histograms exposed in Prometheus text format
+Metrics of sharded worker processes are collected from them on every scrape and summed with own ones.
+Also contains optional sampling profiler showing where threads spend time
+"""
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+lock = threading.Lock()
+counters = collections.defaultdict(float)  # {(name, labels): value}
+histograms = {}  # {(name, labels): [bucket counts..., sum, count]}
+descriptions = {}  # {name: (type, help, buckets)}
+sources = []  # functions returning snapshot of metrics of other processes, see add_source
+
+
+def describe(name, metric_type, description, buckets=BUCKETS):
+    """
+    Declares metric shown in output
+
+    :param name: string
+    :param metric_type: string 'counter' or 'histogram'
+    :param description: string
+    :param buckets: (float) upper bounds of histogram buckets
+    """
+    descriptions[name] = (metric_type, description, buckets)
+
+
+def get_buckets(name):
+    return descriptions[name][2] if name in descriptions else BUCKETS
+
+
+def inc(name, value=1, **labels):
+    """
+    Increases counter
+
+    :param name: string
+    :param value: float
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        counters[key] += value
+
+
+def observe(name, value, **labels):
+    """
+    Adds value to histogram
+
+    :param name: string
+    :param value: float
+    """
+    key = (name, tuple(sorted(labels.items())))
+    buckets = get_buckets(name)
+    with lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+class timed:
+    """
+    Measures duration to histogram, used as decorator or context manager
+
+        @timed('reminder_tick_seconds')
+        def remind_time(at): ...
+
+        with timed('db_write_wait_seconds'):
+            ...
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+    def __call__(self, function):
+        def wrapper(*args, **kwargs):
+            with timed(self.name, **self.labels):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+
+def snapshot():
+    """
+    Returns copy of metrics of this process
+
+    :return: ({(name, labels): float}, {(name, labels): [float]})
+    """
+    with lock:
+        return dict(counters), {key: list(value) for key, value in histograms.items()}
+
+
+def add_source(get_snapshot):
+    """
+    Adds metrics of another process to output, e.g. of sharded worker
+
+    :param get_snapshot: function() -> result of snapshot() in that process or None if it is not available
+    """
+    sources.append(get_snapshot)
+
+
+def remove_source(get_snapshot):
+    """
+    Removes source added by add_source, e.g. when worker is stopped
+
+    :param get_snapshot: function
+    """
+    if get_snapshot in sources:
+        sources.remove(get_snapshot)
+
+
+def collect():
+    """
+    Sums metrics of this process and of all sources
+
+    :return: ({(name, labels): float}, {(name, labels): [float]})
+    """
+    all_counters, all_histograms = snapshot()
+    for get_snapshot in sources:
+        result = get_snapshot()
+        if result is None:
+            continue
+        for key, value in result[0].items():
+            all_counters[key] = all_counters.get(key, 0) + value
+        for key, value in result[1].items():
+            histogram = all_histograms.get(key)
+            all_histograms[key] = value if histogram is None else [a + b for a, b in zip(histogram, value)]
+    return all_counters, all_histograms
+
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def render():
+    """
+    Returns all metrics of all processes in Prometheus text format
+
+    :return: string
+    """
+    all_counters, all_histograms = collect()
+    counter_items = sorted(all_counters.items())
+    histogram_items = sorted(all_histograms.items())
+    lines = []
+    described = set()
+
+    def header(name):
+        if name not in described and name in descriptions:
+            described.add(name)
+            lines.append(f"# HELP {name} {descriptions[name][1]}")
+            lines.append(f"# TYPE {name} {descriptions[name][0]}")
+
+    for (name, labels), value in counter_items:
+        header(name)
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    for (name, labels), histogram in histogram_items:
+        header(name)
+        for bound, count in zip(get_buckets(name), histogram):
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+        lines.append(f"{name}_sum{format_labels(labels)} {histogram[-2]}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """
+    Sampling profiler. Periodically takes stacks of all threads and counts them
+    Result is shown in collapsed stacks format, suitable for flame graphs
+    """
+
+    def __init__(self, interval):
+        """
+        :param interval: float seconds between samples
+        """
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.running = False
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        own_id = threading.get_ident()
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_filename}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def render(self):
+        """
+        Returns collected stacks, most frequent first
+
+        :return: string
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+profiler = Profiler(config.PROFILER_INTERVAL_SECONDS)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    /metrics - metrics in Prometheus format
+    /profile - collected stacks, /profile/start and /profile/stop toggle profiler
+    """
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = render()
+        elif self.path == '/profile':
+            body = profiler.render()
+        elif self.path == '/profile/start':
+            profiler.start()
+            body = 'started\n'
+        elif self.path == '/profile/stop':
+            profiler.stop()
+            body = 'stopped\n'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # scraping requests are not written to bot log
+        pass
+
+
+def start_server():
+    """
+    Starts metrics http server in background thread on METRICS_HOST:METRICS_PORT
+    """
+    server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if config.PROFILER_ENABLED:
+        profiler.start()
+    return server
+
+
+def _reset_after_fork():
+    """
+    Forked worker counts only its own metrics, they are added to parent's ones on scrape
+    """
+    global lock
+    lock = threading.Lock()
+    counters.clear()
+    histograms.clear()
+    sources.clear()
+    profiler.running = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+describe('handler_latency_seconds', 'histogram', 'Time spent in message handler')
+describe('handler_db_queries', 'histogram', 'Database queries made by one message handler', COUNT_BUCKETS)
+describe('db_queries_total', 'counter', 'Database queries')
+describe('db_write_wait_seconds', 'histogram', 'Time write waited for commit by writer thread')
+describe('reminder_tick_seconds', 'histogram', 'Time spent sending reminders of one remind time')
+describe('messages_sent_total', 'counter', 'Bulk sent messages by delivery result')
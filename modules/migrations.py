@@ -0,0 +1,132 @@
+import logging
+
+from modules import db
+from settings.config import LOGGER_NAME
+
+"""
+Schema migrations of the database
+Applied schema version is stored in sqlite `user_version` pragma.
+To change schema append new migration with next version number, never edit applied ones
+"""
+
+MIGRATIONS = [
+    (1, [
+        # get_cohort_lessons and timetable reload by course group
+        "CREATE INDEX IF NOT EXISTS group_lessons_cohort ON group_lessons (course, lesson_group, day)",
+        "CREATE INDEX IF NOT EXISTS common_lessons_course ON common_lessons (course, day)",
+        # get_users_with_reminders and get_reminder_cohorts, telegram_id is rowid and is covered too
+        "CREATE INDEX IF NOT EXISTS users_reminders ON users (need_reminders, course, course_group, telegram_alias)",
+        # get_id_by_alias
+        "CREATE INDEX IF NOT EXISTS users_alias ON users (telegram_alias)",
+    ]),
+    (2, [
+        # conversation steps of chats, see conversation module
+        "CREATE TABLE conversation_state ("
+        "chat_id INTEGER NOT NULL PRIMARY KEY, "
+        "step TEXT NOT NULL, "
+        "updated_at INTEGER NOT NULL)",
+        "CREATE INDEX conversation_state_updated ON conversation_state (updated_at)",
+    ]),
+    (3, [
+        # telegram file_id of timetable images, see timetable_photos module
+        "CREATE TABLE timetable_photos ("
+        "photo TEXT NOT NULL PRIMARY KEY, "
+        "asset TEXT NOT NULL, "
+        "file_id TEXT NOT NULL)",
+    ]),
+    (4, [
+        # admin broadcasts with progress, see broadcast module
+        "CREATE TABLE broadcasts ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "text TEXT NOT NULL, "
+        "course TEXT, "
+        "course_group TEXT, "
+        "status TEXT NOT NULL DEFAULT 'running', "
+        "last_user_id INTEGER NOT NULL DEFAULT 0, "
+        "sent INTEGER NOT NULL DEFAULT 0, "
+        "failed INTEGER NOT NULL DEFAULT 0, "
+        "blocked INTEGER NOT NULL DEFAULT 0, "
+        "created_at INTEGER NOT NULL)",
+        # recipients of broadcast to course group are read in id order
+        "CREATE INDEX users_cohort ON users (course, course_group)",
+    ]),
+    (5, [
+        # version of timetable is increased by every import, bots reload timetable when it changes
+        "CREATE TABLE meta (key TEXT NOT NULL PRIMARY KEY, value)",
+        "INSERT INTO meta (key, value) VALUES ('timetable_version', 0)",
+    ]),
+    (6, [
+        # date-specific changes of the weekly timetable, see overrides module
+        "CREATE TABLE lesson_overrides ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "course TEXT NOT NULL, "
+        "course_group TEXT, "  # NULL - all groups of the course
+        "date_from TEXT NOT NULL, "  # YYYY-MM-DD, inclusive
+        "date_to TEXT NOT NULL, "
+        "day INTEGER, "  # NULL - every weekday between dates
+        "week_parity INTEGER, "  # 1 - odd weeks, 0 - even weeks, NULL - every week
+        "start TEXT, "  # start of the changed lesson, NULL for added lessons
+        "action TEXT NOT NULL, "  # cancel, change or add
+        # new values of the lesson, NULL - not changed
+        "subject TEXT, "
+        "type INTEGER, "
+        "teacher TEXT, "
+        "teacher_gender INTEGER, "
+        "new_start TEXT, "
+        "new_end TEXT, "
+        "room TEXT)",
+    ]),
+    (7, [
+        # minutes before lessons user is reminded, 10 was the same for everybody before
+        "ALTER TABLE users ADD COLUMN remind_lead INTEGER NOT NULL DEFAULT 10",
+        # get_reminder_cohorts groups by lead time too
+        "DROP INDEX IF EXISTS users_reminders",
+        "CREATE INDEX users_reminders ON users (need_reminders, course, course_group, remind_lead, telegram_alias)",
+    ]),
+    (8, [
+        # broadcast is claimed by its sender, so it is not resumed while it is still being sent
+        "ALTER TABLE broadcasts ADD COLUMN sender TEXT",
+        # broadcasts left running by the previous version were interrupted by restart
+        "UPDATE broadcasts SET status='interrupted' WHERE status='running'",
+    ]),
+]
+
+
+def get_version(conn):
+    """
+    Returns schema version of database
+
+    :param conn: sqlite3.Connection
+    :return: int
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """
+    Applies all migrations newer than current schema version
+    Every migration is applied in its own transaction together with version update
+    Function is called once on bot start
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    conn = db.connect()
+    try:
+        for version, statements in MIGRATIONS:
+            if version <= get_version(conn):
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version={version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info(f"MIGRATION applied schema version {version}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,251 @@
+import argparse
+import bisect
+import sys
+from datetime import date
+
+from modules import db
+from modules.lesson import Lesson, format_time, parse_time
+from settings.config import REGISTERED_COURSES, SEMESTER_FIRST_MONDAY
+
+"""
+Date-specific changes of the weekly timetable: cancelled lessons, room or time changes,
+extra lessons and lessons taking place only on odd or even weeks
+
+    python -m modules.overrides cancel "Lvl 100" 8:00 --group "Comp Eng" --date 2026-10-20
+    python -m modules.overrides change "Lvl 100" 8:00 --date 2026-10-20 --room B4
+    python -m modules.overrides cancel "Lvl 100" 14:00 --day 2 --parity even --date 2026-09-07 --to 2026-12-18
+    python -m modules.overrides list
+    python -m modules.overrides delete 3
+
+Override is active on every date between date_from and date_to which matches its weekday and week parity.
+Changes are applied to the lesson of the course group starting at `start` on that date
+"""
+
+ACTIONS = ('cancel', 'change', 'add')
+COLUMNS = "id, course, course_group, date_from, date_to, day, week_parity, start, action, " \
+          "subject, type, teacher, teacher_gender, new_start, new_end, room"
+
+
+class Override:
+
+    """
+    One row of lesson_overrides table
+    """
+
+    __slots__ = ('id', 'course', 'course_group', 'first', 'last', 'day', 'week_parity', 'start', 'action',
+                 'subject', 'type', 'teacher', 'teacher_gender', 'new_start', 'new_end', 'room', 'lesson')
+
+    def __init__(self, row):
+        """
+        :param row: tuple of COLUMNS from database
+        """
+        (self.id, self.course, self.course_group, date_from, date_to, self.day, self.week_parity, start, self.action,
+         self.subject, self.type, self.teacher, self.teacher_gender, self.new_start, self.new_end, self.room) = row
+        # dates are compared as ordinals
+        self.first = date.fromisoformat(date_from).toordinal()
+        self.last = date.fromisoformat(date_to).toordinal()
+        self.start = parse_time(start) if start else None
+        # added lesson does not depend on the timetable, so it is made once
+        self.lesson = Lesson((self.subject, self.type or 0, self.teacher, self.teacher_gender or 0,
+                              self.new_start, self.new_end, self.room)) if self.action == 'add' else None
+
+    def matches(self, moment):
+        """
+        Checks weekday and week parity of the date, the date is already known to be inside the interval
+
+        :param moment: date
+        :return: boolean
+        """
+        return (self.day is None or self.day == moment.weekday()) and \
+               (self.week_parity is None or self.week_parity == get_week_number(moment) % 2)
+
+    def apply(self, lesson):
+        """
+        Returns changed copy of lesson
+
+        :param lesson: Lesson
+        :return: Lesson
+        """
+        return Lesson((self.subject or lesson.subject,
+                       Lesson.TYPES.index(lesson.type) if self.type is None else self.type,
+                       self.teacher or lesson.teacher,
+                       lesson.teacher_gender if self.teacher_gender is None else self.teacher_gender,
+                       self.new_start or format_time(lesson.start),
+                       self.new_end or format_time(lesson.end),
+                       lesson.room if self.room is None else self.room))
+
+
+class IntervalIndex:
+
+    """
+    Static index of items valid on intervals of integers
+    Interval bounds split the number line into segments and every segment keeps items covering it,
+    so lookup is one binary search
+    """
+
+    __slots__ = ('bounds', 'segments')
+
+    def __init__(self, intervals):
+        """
+        :param intervals: [(first: int, last: int, item)] bounds are inclusive
+        """
+        self.bounds = sorted({first for first, _, _ in intervals} | {last + 1 for _, last, _ in intervals})
+        # overrides of one course group are few, so segments are filled directly
+        self.segments = [tuple(item for first, last, item in intervals if first <= bound <= last)
+                         for bound in self.bounds]
+
+    def get(self, point):
+        """
+        Returns items which intervals contain point
+
+        :param point: int
+        :return: (item)
+        """
+        position = bisect.bisect_right(self.bounds, point) - 1
+        return self.segments[position] if position >= 0 else ()
+
+
+def get_week_number(moment):
+    """
+    Returns number of week used for odd and even weeks,
+    counted from SEMESTER_FIRST_MONDAY if it is set, otherwise from monday 0001-01-01.
+    ISO week numbers are not used, both 53rd and 1st weeks of the next year would be odd
+
+    :param moment: date
+    :return: int
+    """
+    if SEMESTER_FIRST_MONDAY:
+        return (moment - SEMESTER_FIRST_MONDAY).days // 7 + 1
+    # ordinal 1 is monday, so weeks alternate without breaks between years
+    return (moment.toordinal() - 1) // 7 + 1
+
+
+def load():
+    """
+    Reads all overrides from database and indexes them by course group
+
+    :return: {(course, course_group or None): IntervalIndex}
+    """
+    overrides = {}
+    for row in db.fetchall(f"SELECT {COLUMNS} FROM lesson_overrides ORDER BY id"):
+        override = Override(row)
+        overrides.setdefault((override.course, override.course_group), []).append(
+            (override.first, override.last, override))
+    return {cohort: IntervalIndex(intervals) for cohort, intervals in overrides.items()}
+
+
+def get_active(index, course, course_group, moment):
+    """
+    Returns overrides of course group active on the date in order they were added
+
+    :param index: {(course, course_group or None): IntervalIndex} see load
+    :param course: string
+    :param course_group: string
+    :param moment: date
+    :return: [Override]
+    """
+    point = moment.toordinal()
+    found = []
+    for cohort in ((course, None), (course, course_group)):
+        interval_index = index.get(cohort)
+        if interval_index is not None:
+            found.extend(override for override in interval_index.get(point) if override.matches(moment))
+    found.sort(key=lambda override: override.id)
+    return found
+
+
+def merge(lessons, active):
+    """
+    Applies overrides to weekly lessons of the date
+
+    :param lessons: (Lesson) sorted
+    :param active: [Override] see get_active
+    :return: (Lesson) sorted
+    """
+    lessons = list(lessons)
+    for override in active:
+        if override.action == 'add':
+            lessons.append(override.lesson)
+            continue
+        for number, lesson in enumerate(lessons):
+            if lesson is not None and lesson.start == override.start:
+                lessons[number] = None if override.action == 'cancel' else override.apply(lesson)
+    return tuple(sorted(lesson for lesson in lessons if lesson is not None))
+
+
+def save(sql, params):
+    """
+    Changes lesson_overrides table and increases timetable version in one transaction,
+    so running bots reload timetable together with overrides
+
+    :param sql: string
+    :param params: tuple
+    :return: int id of inserted row
+    """
+    conn = db.connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(sql, params)
+        conn.execute("UPDATE meta SET value=value+1 WHERE key='timetable_version'")
+        conn.execute("COMMIT")
+        return cursor.lastrowid
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m modules.overrides')
+    commands = parser.add_subparsers(dest='action', required=True)
+    commands.add_parser('list')
+    commands.add_parser('delete').add_argument('id', type=int)
+    for action in ACTIONS:
+        command = commands.add_parser(action)
+        command.add_argument('course')
+        if action != 'add':
+            command.add_argument('start', help='start of the lesson, hh:mm')
+        command.add_argument('--group', help='course group, all groups of the course by default')
+        command.add_argument('--date', required=True, type=date.fromisoformat, help='YYYY-MM-DD')
+        command.add_argument('--to', type=date.fromisoformat, help='last date, the same as --date by default')
+        command.add_argument('--day', type=int, choices=range(7), help='only on this weekday')
+        command.add_argument('--parity', choices=('odd', 'even'), help='only on odd or even weeks')
+        if action != 'cancel':
+            command.add_argument('--subject', required=action == 'add')
+            command.add_argument('--type', type=int, choices=range(4), required=action == 'add')
+            command.add_argument('--teacher', required=action == 'add')
+            command.add_argument('--teacher-gender', type=int, choices=(0, 1))
+            command.add_argument('--start-at', required=action == 'add', help='new start, hh:mm')
+            command.add_argument('--end-at', required=action == 'add', help='new end, hh:mm')
+            command.add_argument('--room', required=action == 'add')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.action == 'list':
+        for row in db.fetchall(f"SELECT {COLUMNS} FROM lesson_overrides ORDER BY id"):
+            print(' | '.join('' if value is None else str(value) for value in row))
+        return
+    if args.action == 'delete':
+        save("DELETE FROM lesson_overrides WHERE id=?", (args.id,))
+        return
+    if args.course not in REGISTERED_COURSES or args.group and args.group not in REGISTERED_COURSES[args.course]:
+        sys.exit(f"Unknown course or group: {args.course} {args.group or ''}")
+    for value in (getattr(args, 'start', None), getattr(args, 'start_at', None), getattr(args, 'end_at', None)):
+        if value:
+            parse_time(value)
+    changes = [getattr(args, name, None) for name in ('subject', 'type', 'teacher', 'teacher_gender',
+                                                      'start_at', 'end_at', 'room')]
+    override_id = save(
+        "INSERT INTO lesson_overrides (course, course_group, date_from, date_to, day, week_parity, start, action, "
+        "subject, type, teacher, teacher_gender, new_start, new_end, room) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        (args.course, args.group, args.date.isoformat(), (args.to or args.date).isoformat(), args.day,
+         {'odd': 1, 'even': 0}.get(args.parity), getattr(args, 'start', None), args.action, *changes))
+    print(f"Override #{override_id} saved")
+
+
+if __name__ == '__main__':
+    main()
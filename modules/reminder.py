@@ -1,36 +1,135 @@
+import heapq
+import logging
 import threading
-import time
-
-import schedule
+from datetime import datetime, time, timedelta
 
 from modules import lesson_controller
+from settings.config import LOGGER_NAME, REMIND_LEAD_OPTIONS, REMIND_RETRY_SECONDS
 
 """
 Reminder module runs in the background for reminding users
-It uses the schedule library
+Remind times are kept in a heap and the thread sleeps exactly until the nearest one
 """
 
+WEEK = timedelta(days=7)
 
-def notify_need_remind(call_when_needed):
+
+class Scheduler:
     """
-    Adds remind times in schedule and sets given function to be called
+    Calls function at every remind time: every lead time of REMIND_LEAD_OPTIONS before each lesson start
+    Remind times are planned day by day for one week ahead, so date-specific
+    changes of the timetable are taken into account.
+    All lead times are planned, not only chosen ones, because users change them in other processes
 
-    :param call_when_needed: function
+    Current time is taken from `clock`, so scheduler could be driven by fake clock
     """
-    for time_start in lesson_controller.get_reminder_times():
-        schedule.every().day.at(time_start).do(call_when_needed)
 
+    def __init__(self, call_when_needed, clock=datetime.now):
+        """
+        :param call_when_needed: function(remind_time: datetime)
+        :param clock: function returning current datetime
+        """
+        self.call_when_needed = call_when_needed
+        self.clock = clock
+        self.heap = []  # planned remind times after checked_until
+        self.queued = set()  # remind times in heap, different lessons and leads often give the same time
+        self.checked_until = clock()  # all remind times up to this moment were processed
+        self.planned_until = None  # the last date which lessons are planned
+        self.changed = threading.Event()
+        self.rebuild()
 
-def reminders_pending():
-    """
-    Runs in the background thread and
-    wakes schedule to check if there are new reminders
-    """
-    while 1:
-        schedule.run_pending()
-        time.sleep(30)
+    def rebuild(self):
+        """
+        Recalculates remind times for the next week from timetable
+        """
+        self.heap = []
+        self.queued = set()
+        self.planned_until = self.checked_until.date() - timedelta(days=1)
+        self.plan()
+
+    def plan(self):
+        """
+        Adds remind times of lessons of the days which came into the week after checked_until
+        """
+        leads = [timedelta(minutes=minutes) for minutes in REMIND_LEAD_OPTIONS]
+        # lesson of the day after the week may be reminded inside the week
+        last = (self.checked_until + WEEK).date() + timedelta(days=1)
+        while self.planned_until < last:
+            # day is marked planned only after its lessons are read, failed day is planned again
+            day = self.planned_until + timedelta(days=1)
+            for hour, minute in lesson_controller.get_start_times(day):
+                start = datetime.combine(day, time(hour, minute))
+                for lead in leads:
+                    remind_time = start - lead
+                    if self.checked_until < remind_time and remind_time not in self.queued:
+                        self.queued.add(remind_time)
+                        heapq.heappush(self.heap, remind_time)
+            self.planned_until = day
+
+    def run_pending(self):
+        """
+        Calls function for every remind time that came
+        Failed call is logged and skipped, so one bad remind time does not stop the next ones
+        """
+        now = self.clock()
+        while self.heap and self.heap[0] <= now:
+            remind_time = heapq.heappop(self.heap)
+            self.queued.discard(remind_time)
+            try:
+                self.call_when_needed(remind_time)
+            except Exception as exception:
+                logging.getLogger(LOGGER_NAME).exception(f"REMIND failed at {remind_time}: {exception}")
+        self.checked_until = max(self.checked_until, now)
+        self.plan()
+
+    def seconds_until_next(self):
+        """
+        Returns amount of seconds until the nearest remind time
+        or until the next day has to be planned if it is earlier
 
+        :return: float
+        """
+        wake_at = datetime.combine(self.planned_until, time()) - WEEK
+        if self.heap:
+            wake_at = min(wake_at, self.heap[0])
+        return max(0, (wake_at - self.clock()).total_seconds())
 
-# start reminders_pending in background thread
-# daemon=True means die if main thread dies
-threading.Thread(target=reminders_pending, daemon=True).start()
+    def notify_changed(self):
+        """
+        Wakes the scheduler to recalculate remind times, called on timetable change
+        """
+        self.changed.set()
+
+    def run(self):
+        """
+        Runs in the background thread. Sleeps until the nearest remind time
+        or until timetable is changed
+        """
+        while 1:
+            try:
+                self.run_pending()
+                timeout = self.seconds_until_next()
+            except Exception as exception:
+                # timetable could not be read, remind times are planned again after pause
+                logging.getLogger(LOGGER_NAME).exception(f"REMIND planning failed: {exception}")
+                timeout = REMIND_RETRY_SECONDS
+            if self.changed.wait(timeout):
+                self.changed.clear()
+                try:
+                    self.rebuild()
+                except Exception as exception:
+                    logging.getLogger(LOGGER_NAME).exception(f"REMIND planning failed: {exception}")
+
+
+def notify_need_remind(call_when_needed):
+    """
+    Starts scheduler in background thread and sets given function to be called in remind times
+
+    :param call_when_needed: function(remind_time: datetime)
+    :return: Scheduler
+    """
+    scheduler = Scheduler(call_when_needed)
+    lesson_controller.on_timetable_change(scheduler.notify_changed)
+    # daemon=True means die if main thread dies
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    return scheduler
@@ -0,0 +1,88 @@
+from datetime import date, datetime
+
+from modules import lesson_controller
+from settings import strings
+
+"""
+Rendered replies for schedule buttons
+Reply depends only on course group, day and minute, so it is rendered once and shared by all users of the group.
+Replies are keyed by timetable version they are rendered from, cache is cleared when timetable is reloaded
+"""
+
+day_replies = {}  # {(version, course, course_group, date): string} for the nearest week only
+day_replies_date = None  # today's date of day_replies
+now_replies = {}  # {(version, course, course_group, date, minute): string} for the current minute only
+now_minute = None
+
+
+def clear():
+    """
+    Forgets all rendered replies, called when timetable is changed
+    """
+    day_replies.clear()
+    now_replies.clear()
+
+
+lesson_controller.on_timetable_change(clear)
+
+
+def get_day_reply(course, course_group, day):
+    """
+    Returns schedule of course group for the nearest date of exact weekday
+
+    :param course: string
+    :param course_group: string
+    :param day: int [0-6]
+    :return: string
+    """
+    global day_replies_date
+    moment = lesson_controller.get_upcoming_date(day)
+    if day_replies_date != date.today():
+        # dates of the past are not needed anymore
+        day_replies.clear()
+        day_replies_date = date.today()
+    timetable = lesson_controller.get_state()
+    # reply rendered during reload from the old timetable is never taken for the new one
+    key = (timetable.version, course, course_group, moment)
+    reply = day_replies.get(key)
+    if reply is None:
+        schedule = lesson_controller.get_effective_lessons(course, course_group, moment, timetable)
+        # convert lessons to understandable string output
+        reply = strings.MESSAGE_FREE_DAY if not schedule else \
+            strings.HEADER_SEPARATOR.join(str(lesson) for lesson in schedule)
+        day_replies[key] = reply
+    return reply
+
+
+def get_now_reply(course, course_group, moment=None):
+    """
+    Returns current and next lessons of course group with time left
+    Reply is calculated once per minute
+
+    :param course: string
+    :param course_group: string
+    :param moment: datetime, current time by default
+    :return: string
+    """
+    global now_minute
+    if moment is None:
+        moment = datetime.now()
+    now = moment.hour * 60 + moment.minute
+    day = moment.date()
+    if now_minute != (day, now):
+        # replies of previous minute are not needed anymore
+        now_replies.clear()
+        now_minute = (day, now)
+    timetable = lesson_controller.get_state()
+    key = (timetable.version, course, course_group, day, now)
+    reply = now_replies.get(key)
+    if reply is None:
+        lessons = lesson_controller.get_effective_lessons(course, course_group, day, timetable)
+        current_lesson = next((lesson for lesson in lessons if lesson.start <= now < lesson.end), None)
+        next_lesson = next((lesson for lesson in lessons if now < lesson.start), None)
+        # add headers if needed
+        reply = strings.HEADER_NOW + current_lesson.get_str_current(now) if current_lesson else ""
+        reply += strings.HEADER_NEXT + next_lesson.get_str_future(now) if next_lesson else \
+            strings.HEADER_NO_NEXT_LESSONS
+        now_replies[key] = reply
+    return reply
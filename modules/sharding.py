@@ -0,0 +1,160 @@
+import logging
+import multiprocessing
+import threading
+
+from modules import lesson_controller
+from modules import metrics
+from modules import webhook
+from settings.config import LOGGER_NAME, SHARD_METRICS_TIMEOUT_SECONDS
+
+"""
+Sharded update processing: every update is handled by one of worker processes chosen by chat id.
+All updates of one chat go to the same worker in order they came,
+so conversation steps of the chat are kept in that worker.
+Workers share the same sqlite database.
+Metrics of workers are requested through pipes when parent's metrics are scraped
+"""
+
+UPDATE_KEYS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+
+def get_chat_id(raw_update):
+    """
+    Returns id of chat the update belongs to, 0 if update has no chat
+
+    :param raw_update: dict
+    :return: int
+    """
+    for key in UPDATE_KEYS:
+        if key in raw_update:
+            return raw_update[key]['chat']['id']
+    if 'callback_query' in raw_update:
+        query = raw_update['callback_query']
+        return query['message']['chat']['id'] if 'message' in query else query['from']['id']
+    for value in raw_update.values():
+        # inline queries, polls answers e.t.c. have only sender
+        if isinstance(value, dict) and 'from' in value:
+            return value['from']['id']
+    return 0
+
+
+class ShardedDispatcher:
+    """
+    Routes raw updates to worker processes by chat id
+    """
+
+    def __init__(self, bot, workers):
+        """
+        :param bot: Telebot with registered handlers, workers get its copy
+        :param workers: int number of worker processes
+        """
+        self.bot = bot
+        self.workers = workers
+        self.queues = []
+        self.processes = []
+        self.metric_sources = []
+
+    def start(self):
+        """
+        Forks worker processes. Should be called before any background thread is started
+        """
+        context = multiprocessing.get_context('fork')  # workers inherit registered handlers
+        for _ in range(self.workers):
+            updates = context.Queue()
+            parent_pipe, worker_pipe = context.Pipe()
+            process = context.Process(target=work, args=(self.bot, updates, worker_pipe), daemon=True)
+            process.start()
+            self.queues.append(updates)
+            self.processes.append(process)
+            self.metric_sources.append(MetricsPipe(parent_pipe).request)
+            metrics.add_source(self.metric_sources[-1])
+
+    def dispatch(self, raw_update):
+        """
+        Sends update to the worker of its chat
+        Queue is unbounded and pickling is done by its feeder thread, so the call does not block
+        and could be made from the event loop
+
+        :param raw_update: dict
+        """
+        self.queues[get_chat_id(raw_update) % self.workers].put_nowait(raw_update)
+
+    def stop(self):
+        """
+        Asks workers to finish queued updates and waits for them
+        """
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            process.join()
+        for source in self.metric_sources:
+            metrics.remove_source(source)
+
+
+class MetricsPipe:
+    """
+    Parent side of pipe to worker answering with its metrics snapshot
+    """
+
+    def __init__(self, pipe):
+        """
+        :param pipe: multiprocessing.connection.Connection
+        """
+        self.pipe = pipe
+        self.lock = threading.Lock()  # scrapes are served by several threads
+
+    def request(self):
+        """
+        Returns metrics snapshot of the worker or None if it did not answer in time
+
+        :return: see metrics.snapshot
+        """
+        with self.lock:
+            try:
+                # answers of requests which timed out before are not needed
+                while self.pipe.poll():
+                    self.pipe.recv()
+                self.pipe.send(None)
+                if self.pipe.poll(SHARD_METRICS_TIMEOUT_SECONDS):
+                    return self.pipe.recv()
+            except (EOFError, OSError):
+                pass  # worker is dead
+            return None
+
+
+def serve_metrics(pipe):
+    """
+    Runs in background thread of worker process and answers every request with metrics snapshot
+
+    :param pipe: multiprocessing.connection.Connection
+    """
+    try:
+        while 1:
+            pipe.recv()
+            pipe.send(metrics.snapshot())
+    except (EOFError, OSError):
+        pass  # parent is gone
+
+
+def work(bot, updates, metrics_pipe):
+    """
+    Runs in worker process. Handles updates one by one, so updates of one chat keep their order
+
+    :param bot: Telebot
+    :param updates: multiprocessing.Queue
+    :param metrics_pipe: multiprocessing.connection.Connection, see serve_metrics
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    # thread pool of the bot was not copied to this process, handlers are called directly
+    bot.threaded = False
+    # every worker has its own timetable cache
+    threading.Thread(target=lesson_controller.watch_timetable, daemon=True).start()
+    threading.Thread(target=serve_metrics, args=(metrics_pipe,), daemon=True).start()
+    while 1:
+        raw_update = updates.get()
+        if raw_update is None:
+            return
+        try:
+            webhook.process_update(bot, raw_update)
+        except Exception as exception:
+            logger.exception(f"SHARD failed to process update {raw_update.get('update_id')}: {exception}")
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import json
+import logging
+import re
+import sys
+import time
+
+from modules import db
+from modules.lesson import parse_time
+from settings.config import LOGGER_NAME, REGISTERED_COURSES, TIMETABLE_IMPORT_CHUNK
+
+"""
+Bulk import of timetable from CSV, JSON or JSON lines file
+
+    python -m modules.timetable_import timetable.csv
+
+Every row has fields: course, lesson_group (empty for lessons common for the course), day,
+subject, type, teacher, teacher_gender, start, end, room.
+Rows are loaded into staging tables in one transaction and staging tables replace lesson tables atomically,
+so running bots read either old or new timetable. Bots notice new timetable version and reload their caches
+"""
+
+FIELDS = ('course', 'lesson_group', 'day', 'subject', 'type', 'teacher', 'teacher_gender', 'start', 'end', 'room')
+TABLES = ('common_lessons', 'group_lessons')
+
+
+class TimetableError(Exception):
+    """
+    Raised if timetable file has invalid rows
+    """
+
+
+def read_rows(path):
+    """
+    Generator of rows of timetable file as dicts
+
+    :param path: string .csv, .json (array of objects) or .jsonl (object per line)
+    :return: generator of (line: int, dict)
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                yield line, row
+        elif path.endswith('.jsonl'):
+            for line, text in enumerate(f, start=1):
+                if text.strip():
+                    yield line, json.loads(text)
+        else:
+            for line, row in enumerate(json.load(f), start=1):
+                yield line, row
+
+
+def validate(line, row):
+    """
+    Checks row and converts it to database types
+
+    :param line: int number of row in file, used in error message
+    :param row: dict
+    :return: (course, lesson_group or None, day, subject, type, teacher, teacher_gender, start, end, room)
+    """
+    missing = [field for field in FIELDS if field != 'lesson_group' and row.get(field) in (None, '')]
+    if missing:
+        raise TimetableError(f"line {line}: missing {', '.join(missing)}")
+    course = row['course']
+    lesson_group = row.get('lesson_group') or None
+    if course not in REGISTERED_COURSES:
+        raise TimetableError(f"line {line}: unknown course {course}")
+    if lesson_group and lesson_group not in REGISTERED_COURSES[course]:
+        raise TimetableError(f"line {line}: unknown group {lesson_group} of {course}")
+    try:
+        day, lesson_type, teacher_gender = int(row['day']), int(row['type']), int(row['teacher_gender'])
+        start, end = parse_time(row['start']), parse_time(row['end'])
+    except ValueError:
+        raise TimetableError(f"line {line}: day, type, teacher_gender must be numbers, start and end must be hh:mm")
+    if not 0 <= day <= 6 or not 0 <= lesson_type <= 3 or not 0 <= start < end <= 24 * 60:
+        raise TimetableError(f"line {line}: wrong day, type or time")
+    return (course, lesson_group, day, row['subject'], lesson_type, row['teacher'], teacher_gender,
+            row['start'], row['end'], row['room'])
+
+
+def chunks(rows, size):
+    """
+    Splits iterable into lists of given size
+
+    :param rows: iterable
+    :param size: int
+    :return: generator of lists
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_timetable(path):
+    """
+    Replaces whole timetable by rows from file
+    Nothing is changed if any row is invalid
+
+    :param path: string
+    :return: {'common': int, 'group': int, 'seconds': float, 'version': int}
+    """
+    started = time.monotonic()
+    conn = db.connect()
+    counts = {'common': 0, 'group': 0}
+    try:
+        schema = {name: sql for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type='table' AND name IN (?,?)", TABLES)}
+        indexes = [sql for (sql,) in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL AND tbl_name IN (?,?)", TABLES)]
+
+        conn.execute("BEGIN IMMEDIATE")
+        for table in TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {table}_staging")
+            # the same columns and constraints as the original table
+            conn.execute(re.sub(r'^(CREATE TABLE (IF NOT EXISTS )?)\S+', rf'\1"{table}_staging"', schema[table]))
+
+        for chunk in chunks((validate(line, row) for line, row in read_rows(path)), TIMETABLE_IMPORT_CHUNK):
+            common = [row[:1] + row[2:] for row in chunk if row[1] is None]
+            group = [row[:1] + row[2:] + row[1:2] for row in chunk if row[1] is not None]
+            conn.executemany("INSERT INTO common_lessons_staging (course, day, subject, type, teacher, "
+                             "teacher_gender, start, end, room) VALUES (?,?,?,?,?,?,?,?,?)", common)
+            conn.executemany("INSERT INTO group_lessons_staging (course, day, subject, type, teacher, "
+                             "teacher_gender, start, end, room, lesson_group) VALUES (?,?,?,?,?,?,?,?,?,?)", group)
+            counts['common'] += len(common)
+            counts['group'] += len(group)
+
+        # swap tables, readers see the change only after commit
+        for table in TABLES:
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {table}_staging RENAME TO {table}")
+        for sql in indexes:
+            conn.execute(sql)
+        conn.execute("UPDATE meta SET value=value+1 WHERE key='timetable_version'")
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        version = conn.execute("SELECT value FROM meta WHERE key='timetable_version'").fetchone()[0]
+        conn.close()
+    result = dict(counts, seconds=round(time.monotonic() - started, 3), version=version)
+    logging.getLogger(LOGGER_NAME).info(f"IMPORT timetable {path}: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m modules.timetable_import')
+    parser.add_argument('path', help='.csv, .json or .jsonl timetable file')
+    try:
+        print(import_timetable(parser.parse_args().path))
+    except TimetableError as error:
+        print(f"Timetable was not changed: {error}")
+        sys.exit(1)
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+
+from modules import db
+from modules import timetable_render
+from settings.config import RENDER_TIMETABLES, TIMETABLE_PHOTOS, TIMETABLE_MANIFEST_FILE_NAME
+
+"""
+Registry of weekly timetable images of course groups
+Image is drawn from database if possible, otherwise static image from photos/ is used.
+Image is sent by telegram file_id if it was sent before, otherwise by uploaded url or local file.
+file_id is remembered together with the asset it was made from, so changed image is sent again
+"""
+
+urls = None  # {photo file: uploaded url}
+file_ids = None  # {photo file or drawn course group: (asset, telegram file_id)}
+lock = threading.Lock()
+
+
+def _read():
+    """
+    Reads uploaded urls from manifest and known file_ids from database
+
+    :return: ({photo file: url}, {photo file or drawn course group: (asset, file_id)})
+    """
+    new_urls = {}
+    if os.path.exists(TIMETABLE_MANIFEST_FILE_NAME):
+        with open(TIMETABLE_MANIFEST_FILE_NAME) as f:
+            new_urls = {photo: entry['url'] for photo, entry in json.load(f).items()}
+    return new_urls, {photo: (asset, file_id) for photo, asset, file_id in
+                      db.fetchall("SELECT photo, asset, file_id FROM timetable_photos")}
+
+
+def _load():
+    global urls, file_ids
+    with lock:
+        if file_ids is None:
+            urls, file_ids = _read()
+
+
+def reload():
+    """
+    Reads manifest of uploaded images again, called after images are uploaded
+    New dicts replace old ones at once, so concurrent sends never see them missing
+    """
+    global urls, file_ids
+    with lock:
+        urls, file_ids = _read()
+
+
+def get_photo_file(course, course_group):
+    """
+    Returns local image file of course group timetable or None
+
+    :param course: string
+    :param course_group: string
+    :return: string or None
+    """
+    return TIMETABLE_PHOTOS.get((course, course_group))
+
+
+def get_asset(photo):
+    """
+    Returns what image is sent from: uploaded url or local file
+
+    :param photo: string local image file
+    :return: string
+    """
+    if file_ids is None:
+        _load()
+    return urls.get(photo) or photo
+
+
+def send_timetable_photo(bot, chat_id, course, course_group):
+    """
+    Sends timetable image of course group to chat
+    Remembers telegram file_id of the image after the first send
+
+    :param bot: Telebot
+    :param chat_id: int
+    :param course: string
+    :param course_group: string
+    """
+    rendered = timetable_render.get_image(course, course_group) if RENDER_TIMETABLES else None
+    if rendered:
+        # path of drawn image changes with its content
+        photo, asset = f"render:{course}:{course_group}", rendered
+    else:
+        photo = get_photo_file(course, course_group)
+        if photo is None:
+            return
+        asset = get_asset(photo)
+    if file_ids is None:
+        _load()
+    known_asset, file_id = file_ids.get(photo, (None, None))
+    if file_id and known_asset == asset:
+        bot.send_photo(chat_id, file_id)
+        return
+
+    if os.path.exists(asset):
+        with open(asset, 'rb') as f:
+            sent = bot.send_photo(chat_id, f)
+    else:
+        sent = bot.send_photo(chat_id, asset)
+    # the largest size of the photo is the last one
+    file_id = sent.photo[-1].file_id
+    db.execute("INSERT OR REPLACE INTO timetable_photos (photo, asset, file_id) VALUES (?,?,?)",
+               (photo, asset, file_id))
+    file_ids[photo] = (asset, file_id)
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from modules import lesson_controller
+from modules.lesson import format_time
+from settings import config
+from settings import strings
+
+"""
+Draws weekly timetable images of course groups straight from lesson tables
+Images are cached on disk by hash of lessons they are drawn from,
+so after timetable change only images of changed course groups are drawn again.
+Drawing needs Pillow, without it static images from photos/ are used
+"""
+
+COLUMN_WIDTH = 320
+ROW_HEIGHT = 90
+HEADER_HEIGHT = 50
+MARGIN = 10
+
+images = {}  # {(course, course_group): path or None}, cleared when timetable is changed
+lesson_controller.on_timetable_change(images.clear)
+
+
+def get_cohort_rows(course, course_group):
+    """
+    Returns everything shown on timetable image of course group
+
+    :param course: string
+    :param course_group: string
+    :return: ((day, start, end, subject, type, teacher, room))
+    """
+    return tuple((day, lesson.start, lesson.end, lesson.subject, lesson.type, lesson.teacher, str(lesson.room))
+                 for day in range(len(strings.TEXT_DAYS_OF_WEEK))
+                 for lesson in lesson_controller.get_cohort_lessons(course, course_group, day))
+
+
+def get_image_path(rows):
+    """
+    Returns path of cached image for given lessons
+
+    :param rows: result of get_cohort_rows
+    :return: string
+    """
+    digest = hashlib.sha256(repr(rows).encode()).hexdigest()
+    return os.path.join(config.RENDER_CACHE_DIR, digest + '.png')
+
+
+def draw(rows, path):
+    """
+    Draws timetable image and saves it to path
+    Runs in worker process of pre-warming pool, so receives everything it needs in arguments
+
+    :param rows: result of get_cohort_rows
+    :param path: string
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    days = len(strings.TEXT_DAYS_OF_WEEK)
+    columns = [[row for row in rows if row[0] == day] for day in range(days)]
+    height = HEADER_HEIGHT + ROW_HEIGHT * max([len(column) for column in columns] + [1]) + MARGIN
+    image = Image.new('RGB', (COLUMN_WIDTH * days, height), 'white')
+    canvas = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    for day, column in enumerate(columns):
+        left = COLUMN_WIDTH * day
+        canvas.text((left + MARGIN, MARGIN), strings.TEXT_DAYS_OF_WEEK[day], fill='black', font=font)
+        for i, (_, start, end, subject, lesson_type, teacher, room) in enumerate(column):
+            top = HEADER_HEIGHT + ROW_HEIGHT * i
+            canvas.rectangle((left + MARGIN // 2, top, left + COLUMN_WIDTH - MARGIN // 2, top + ROW_HEIGHT - MARGIN // 2),
+                             outline='gray')
+            canvas.multiline_text((left + MARGIN, top + MARGIN),
+                                  f"{format_time(start)} - {format_time(end)}\n{subject} {lesson_type}\n"
+                                  f"{teacher}\n{room}", fill='black', font=font)
+    # write to temporary file first, so half written image is never sent
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(temp_path, format='PNG')
+    os.replace(temp_path, path)
+
+
+def get_image(course, course_group):
+    """
+    Returns path of timetable image of course group, draws it if needed
+    Returns None if images can not be drawn
+
+    :param course: string
+    :param course_group: string
+    :return: string or None
+    """
+    key = (course, course_group)
+    if key in images:
+        return images[key]
+    rows = get_cohort_rows(course, course_group)
+    path = get_image_path(rows)
+    if not os.path.exists(path):
+        try:
+            os.makedirs(config.RENDER_CACHE_DIR, exist_ok=True)
+            draw(rows, path)
+        except ImportError:
+            path = None
+    images[key] = path
+    return path
+
+
+def prewarm():
+    """
+    Draws images of all course groups missing in cache in parallel processes
+    Called on start and after timetable changes
+    """
+    try:
+        import PIL  # noqa: F401 check drawing is possible before starting processes
+    except ImportError:
+        return
+    os.makedirs(config.RENDER_CACHE_DIR, exist_ok=True)
+    missing = {}
+    for course, course_group in config.TIMETABLE_PHOTOS:
+        rows = get_cohort_rows(course, course_group)
+        path = get_image_path(rows)
+        if not os.path.exists(path):
+            missing[path] = rows
+    if not missing:
+        return
+    # bot has running threads, forked child could inherit locks held by them, so processes are spawned
+    with ProcessPoolExecutor(max_workers=config.RENDER_WORKERS,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        list(executor.map(draw, missing.values(), missing.keys()))
+    logging.getLogger(config.LOGGER_NAME).info(f"RENDER drew {len(missing)} timetable images")
@@ -12,7 +12,8 @@ class User:
                      course: string,
                      course_group: string,
                      english_group: string,
-                     need_reminders: int)
+                     need_reminders: int,
+                     remind_lead: int minutes before lessons to remind)
         """
         self.id = arg[0]
         self.alias = arg[1]
@@ -20,3 +21,4 @@ class User:
         self.course_group = arg[3]
         self.english_group = arg[4]
         self.need_reminders = arg[5]
+        self.remind_lead = arg[6]
@@ -1,11 +1,91 @@
-import sqlite3
+from collections import OrderedDict
+import os
 import threading
+import time
 
+from modules import db
 from modules.user import User
+from settings.config import REMIND_WHEN_LEFT_MINUTES, USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
 
-conn = sqlite3.connect('db.sqlite', check_same_thread=False)
-cursor = conn.cursor()  # cursor allows to iterate over database data
-lock = threading.RLock()  # at any moment of time only one thread may request db. All others are waiting
+
+class UserCache:
+    """
+    Bounded LRU cache of users by telegram id with time to live
+    Keeps None for ids, that are not registered, so unknown users do not hit database too.
+    Cached users are shared between threads and never changed, writes drop them from the cache.
+    Every read from database after a miss gets a fill token, which is dropped together with the user,
+    so user read before the write is not cached after it. Reads of other users are not affected
+    """
+
+    def __init__(self, size, ttl):
+        """
+        :param size: int max number of cached users
+        :param ttl: float seconds after which user is read from database again
+        """
+        self.size = size
+        self.ttl = ttl
+        self.users = OrderedDict()  # {id: (User or None, expires)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = {}  # {id: token of the latest read from database}, see put
+
+    def get(self, user_id):
+        """
+        Returns (True, User or None) if user is cached,
+        (False, token) otherwise, token must be passed to put with user read from database
+
+        :param user_id: int
+        :return: (boolean, User or None or object)
+        """
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                token = self.fills[user_id] = object()
+                return False, token
+            self.users.move_to_end(user_id)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, user_id, user, token):
+        """
+        Caches user unless it was dropped or read again since token was taken,
+        then the user could be read before the write and would be stale
+
+        :param user_id: int
+        :param user: User or None
+        :param token: object returned by get before user was read
+        """
+        with self.lock:
+            if self.fills.get(user_id) is not token:
+                return
+            del self.fills[user_id]
+            self.users[user_id] = (user, time.monotonic() + self.ttl)
+            self.users.move_to_end(user_id)
+            if len(self.users) > self.size:
+                self.users.popitem(last=False)
+
+    def pop(self, user_id):
+        """
+        Drops user from cache, called after user is changed in database
+
+        :param user_id: int
+        """
+        with self.lock:
+            self.users.pop(user_id, None)
+            self.fills.pop(user_id, None)
+
+
+cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+
+def _reset_cache_after_fork():
+    # lock of the cache could be held by another thread of parent process at the moment of fork
+    cache.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_cache_after_fork)
 
 
 def register(user_id, alias):
@@ -15,9 +95,9 @@ def register(user_id, alias):
     :param user_id: int
     :param alias: string
     """
-    with lock:
-        cursor.execute("INSERT INTO users (telegram_id, telegram_alias) VALUES (?,?)", (user_id, alias,))
-        conn.commit()
+    db.execute("INSERT INTO users (telegram_id, telegram_alias, remind_lead) VALUES (?,?,?)",
+               (user_id, alias, REMIND_WHEN_LEFT_MINUTES))
+    cache.pop(user_id)
 
 
 def set_course(user_id, course):
@@ -27,9 +107,8 @@ def set_course(user_id, course):
     :param user_id: int
     :param course: string
     """
-    with lock:
-        cursor.execute("UPDATE users SET course=? WHERE telegram_id=?", (course, user_id))
-        conn.commit()
+    db.execute("UPDATE users SET course=? WHERE telegram_id=?", (course, user_id))
+    cache.pop(user_id)
 
 
 def set_course_group(user_id, course_group):
@@ -39,9 +118,8 @@ def set_course_group(user_id, course_group):
     :param user_id: int
     :param course_group: string
     """
-    with lock:
-        cursor.execute("UPDATE users SET course_group=? WHERE telegram_id=?", (course_group, user_id))
-        conn.commit()
+    db.execute("UPDATE users SET course_group=? WHERE telegram_id=?", (course_group, user_id))
+    cache.pop(user_id)
 
 
 def set_reminders(user_id, need_reminders):
@@ -53,9 +131,19 @@ def set_reminders(user_id, need_reminders):
     :param user_id: int
     :param need_reminders: int [0-1]
     """
-    with lock:
-        cursor.execute("UPDATE users SET need_reminders=? WHERE telegram_id=?", (1 if need_reminders else 0, user_id))
-        conn.commit()
+    db.execute("UPDATE users SET need_reminders=? WHERE telegram_id=?", (1 if need_reminders else 0, user_id))
+    cache.pop(user_id)
+
+
+def set_remind_lead(user_id, remind_lead):
+    """
+    Sets how many minutes before lessons user is reminded
+
+    :param user_id: int
+    :param remind_lead: int one of REMIND_LEAD_OPTIONS
+    """
+    db.execute("UPDATE users SET remind_lead=? WHERE telegram_id=?", (remind_lead, user_id))
+    cache.pop(user_id)
 
 
 def set_alias(user_id, alias):
@@ -65,22 +153,25 @@ def set_alias(user_id, alias):
     :param user_id: int
     :param alias: string
     """
-    with lock:
-        cursor.execute("UPDATE users SET telegram_alias=? WHERE telegram_id=?", (alias, user_id,))
-        conn.commit()
+    db.execute("UPDATE users SET telegram_alias=? WHERE telegram_id=?", (alias, user_id,))
+    cache.pop(user_id)
 
 
 def get(user_id):
     """
     Function returns User by his telegram id or None if user not found
+    User is taken from cache if possible
 
     :param user_id: int
     :return: User or None
     """
-    with lock:
-        cursor.execute("SELECT * FROM users WHERE telegram_id=?", (user_id,))
-        data = cursor.fetchone()
-    return User(data) if data else None
+    cached, found = cache.get(user_id)
+    if cached:
+        return found
+    data = db.fetchone("SELECT * FROM users WHERE telegram_id=?", (user_id,))
+    user = User(data) if data else None
+    cache.put(user_id, user, found)
+    return user
 
 
 def get_id_by_alias(alias):
@@ -90,9 +181,7 @@ def get_id_by_alias(alias):
     :param alias: string
     :return: int or None
     """
-    with lock:
-        cursor.execute("SELECT telegram_id FROM users WHERE telegram_alias=?", (alias,))
-        data = cursor.fetchone()
+    data = db.fetchone("SELECT telegram_id FROM users WHERE telegram_alias=?", (alias,))
     return data[0] if data else None
 
 
@@ -128,9 +217,20 @@ def delete(user_id):
 
     :param user_id: int
     """
-    with lock:
-        cursor.execute("DELETE FROM users WHERE telegram_id=?", (user_id,))
-        conn.commit()
+    db.execute("DELETE FROM users WHERE telegram_id=?", (user_id,))
+    cache.pop(user_id)
+
+
+def delete_many(user_ids):
+    """
+    Deletes list of users from database in one transaction.
+    Function is called with users, who blocked the bot, after bulk sending.
+
+    :param user_ids: [int]
+    """
+    db.executemany("DELETE FROM users WHERE telegram_id=?", [(user_id,) for user_id in user_ids])
+    for user_id in user_ids:
+        cache.pop(user_id)
 
 
 def get_users_with_reminders():
@@ -139,19 +239,76 @@ def get_users_with_reminders():
 
     :return: [User]
     """
-    with lock:
-        cursor.execute("SELECT * FROM users WHERE need_reminders=1")
-        data = cursor.fetchall()
+    data = db.fetchall("SELECT * FROM users WHERE need_reminders=1")
     return [User(x) for x in data]
 
 
+def get_reminder_cohorts(buckets=None):
+    """
+    Returns ids of configured users, who allowed to send them reminders,
+    grouped by their course, course group and remind lead time
+
+    :param buckets: [(course, course_group, remind_lead)] only these groups are read, all by default
+    :return: {(course: string, course_group: string, remind_lead: int): [int]}
+    """
+    sql = "SELECT course, course_group, remind_lead, group_concat(telegram_id) FROM users " \
+          "WHERE need_reminders=1 AND telegram_alias != '' AND course != '' AND course_group != '' {0}" \
+          "GROUP BY course, course_group, remind_lead"
+    if buckets is None:
+        data = db.fetchall(sql.format(''))
+    else:
+        data = []
+        # every bucket is looked up by users_reminders index, chunks keep number of sqlite variables small
+        for first in range(0, len(buckets), 300):
+            chunk = buckets[first:first + 300]
+            condition = f"AND (course, course_group, remind_lead) IN (VALUES {','.join(['(?,?,?)'] * len(chunk))}) "
+            data += db.fetchall(sql.format(condition), [value for bucket in chunk for value in bucket])
+    return {(course, course_group, remind_lead): [int(x) for x in ids.split(',')]
+            for course, course_group, remind_lead, ids in data}
+
+
+def iter_user_ids(course=None, course_group=None, after_id=0, batch_size=1000):
+    """
+    Generator of ids of users, optionally only of course and course group, ordered by id
+    Reads database by batches, so all users are never loaded at once
+
+    :param course: string or None for all courses
+    :param course_group: string or None for all groups
+    :param after_id: int only users with bigger id are returned
+    :param batch_size: int
+    :return: generator of [int] batches
+    """
+    conditions, params = ["telegram_id>?"], []
+    if course:
+        conditions.append("course=?")
+        params.append(course)
+    if course_group:
+        conditions.append("course_group=?")
+        params.append(course_group)
+    while True:
+        data = db.fetchall(f"SELECT telegram_id FROM users WHERE {' AND '.join(conditions)} "
+                           "ORDER BY telegram_id LIMIT ?", (after_id, *params, batch_size))
+        if not data:
+            return
+        user_ids = [row[0] for row in data]
+        yield user_ids
+        after_id = user_ids[-1]
+
+
 def get_all_users():
     """
     Returns list of all Users
 
     :return: [User]
     """
-    with lock:
-        cursor.execute("SELECT * FROM users")
-        data = cursor.fetchall()
+    data = db.fetchall("SELECT * FROM users")
     return [User(x) for x in data]
+
+
+def get_cache_stats():
+    """
+    Returns number of user cache hits and misses since start
+
+    :return: {'hits': int, 'misses': int, 'size': int}
+    """
+    return {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache.users)}
@@ -0,0 +1,94 @@
+import hmac
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+
+from modules import sharding
+from settings import config
+
+"""
+Webhook mode: telegram pushes updates to async http server instead of being polled.
+Requests are only validated in the event loop, updates are parsed and handled on worker threads.
+Updates of one chat always go to the same single-thread lane, so they are handled in order
+"""
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def process_update(bot, raw_update):
+    """
+    Passes one raw update from telegram to bot handlers
+
+    :param bot: Telebot
+    :param raw_update: dict
+    """
+    bot.process_new_updates([telebot.types.Update.de_json(raw_update)])
+
+
+def make_app(bot, dispatch=None):
+    """
+    Creates aiohttp application receiving updates on WEBHOOK_PATH
+
+    :param bot: Telebot
+    :param dispatch: function(raw_update: dict) called in the event loop, so it must not block,
+                     e.g. ShardedDispatcher.dispatch. By default update is processed by this process
+    :return: aiohttp.web.Application
+    """
+    from aiohttp import web  # webhook dependency is needed only in webhook mode
+
+    lanes = [ThreadPoolExecutor(max_workers=1) for _ in range(config.WEBHOOK_WORKERS)]
+    if dispatch is None:
+        # lanes are the worker pool, handlers are called directly in lane threads to keep order of chat updates
+        bot.threaded = False
+
+        def dispatch(raw_update):
+            # tasks of one executor run in order they were submitted
+            lanes[sharding.get_chat_id(raw_update) % len(lanes)].submit(process_update, bot, raw_update)
+
+    secret = config.WEBHOOK_SECRET.encode()
+
+    async def receive_update(request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, '').encode(), secret):
+            return web.Response(status=403)
+        try:
+            raw_update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        # answer telegram at once, update is only queued here, so updates of one chat keep their order
+        dispatch(raw_update)
+        return web.Response()
+
+    async def shutdown(app):
+        for lane in lanes:
+            lane.shutdown(wait=True)
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, receive_update)
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def check_config():
+    """
+    Raises ValueError if webhook mode can not work with current settings
+    """
+    # telegram does not send the header without secret, so every update would be rejected
+    if not config.WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET must be set in webhook mode")
+
+
+def run_webhook(bot, dispatch=None):
+    """
+    Registers webhook in telegram and serves updates until process is stopped
+
+    :param bot: Telebot
+    :param dispatch: function(raw_update: dict), by default update is processed by this process
+    """
+    from aiohttp import web
+
+    check_config()
+    bot.remove_webhook()
+    bot.set_webhook(url=config.WEBHOOK_URL + config.WEBHOOK_PATH, secret_token=config.WEBHOOK_SECRET)
+    logging.getLogger(config.LOGGER_NAME).info(f"WEBHOOK listening on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}")
+    web.run_app(make_app(bot, dispatch), host=config.WEBHOOK_LISTEN, port=config.WEBHOOK_PORT, print=None)
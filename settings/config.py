@@ -1,3 +1,5 @@
+import os
+
 """
 Configuration file
 All settings are stored here
@@ -5,13 +7,93 @@ All settings are stored here
 
 LOG_FILE_NAME = 'log'
 LOG_MAX_SIZE_BYTES = 1024 * 1024  # MB
+LOG_ROTATE_WHEN = None  # e.g. 'midnight' rotates log every day instead of by size
+LOG_BACKUP_COUNT = 14  # number of gzipped old logs kept
+LOG_MESSAGE_SAMPLE_RATE = 1.0  # part of user messages written to log, other records are always written
 LOGGER_NAME = 'logger'
 
+# telegram ids or aliases of users allowed to use admin commands
+ADMINS = []
+BROADCAST_BATCH_SIZE = 500
+
+DB_FILE_NAME = 'db.sqlite'
+DB_WRITE_BATCH_MAX = 500  # max writes committed in one transaction
+DB_WRITER_CHECK_SECONDS = 10  # how often waiting writes check that writer thread is alive
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECONDS = 10 * 60
+
+CONVERSATION_TTL_SECONDS = 24 * 60 * 60  # unfinished /configure dialogs are forgotten after a day
+
 REGISTERED_COURSES = {'Lvl 100':    ['Telecom Eng', 'Comp Eng'],
                       'Lvl 200':    ['Telecom Eng', 'Comp Eng'],
                       'Lvl 300':    ['Telecom Eng', 'Comp Eng'],
                       'Lvl 400':    ['Telecom Eng', 'Comp Eng'],
                       }
 
+# weekly timetable image of every course group
+TIMETABLE_PHOTOS = {('Lvl 100', 'Telecom Eng'): 'photos/Lvl100.png',
+                    ('Lvl 100', 'Comp Eng'):    'photos/Lvl100.png',
+                    ('Lvl 200', 'Telecom Eng'): 'photos/Lvl200.png',
+                    ('Lvl 200', 'Comp Eng'):    'photos/Lvl200.png',
+                    ('Lvl 300', 'Telecom Eng'): 'photos/Lvl300BTE.png',
+                    ('Lvl 300', 'Comp Eng'):    'photos/Lvl300BCE.png',
+                    ('Lvl 400', 'Telecom Eng'): 'photos/Lvl400BTE.png',
+                    ('Lvl 400', 'Comp Eng'):    'photos/Lvl400BCE.png',
+                    }
+# hashes and cloudinary urls of uploaded timetable images, written by cinary.py
+TIMETABLE_MANIFEST_FILE_NAME = 'timetable_manifest.json'
+UPLOAD_WORKERS = 6
+# draw timetable images from database instead of static ones, needs Pillow
+RENDER_TIMETABLES = True
+RENDER_CACHE_DIR = 'render_cache'
+RENDER_WORKERS = 4
+
+REMIND_WHEN_LEFT_MINUTES = 10  # default for new users
+REMIND_LEAD_OPTIONS = (5, 10, 15, 30)  # minutes before lessons users can choose to be reminded
+REMIND_RETRY_SECONDS = 30  # pause of reminder scheduler after it failed to plan remind times
+
+# datetime.date of monday of the first semester week, used for odd and even weeks and in calendar feeds
+# None - weeks are counted from monday 0001-01-01, so set it if odd weeks must start from the semester
+SEMESTER_FIRST_MONDAY = None
+
+TIMETABLE_CHECK_SECONDS = 30  # how often running bot checks if timetable was imported
+TIMETABLE_IMPORT_CHUNK = 5000  # rows inserted by one executemany
+
+# inline search of lessons
+SEARCH_RESULTS = 20  # inline query results, Telegram shows at most 50
+SEARCH_MAX_PREFIX = 10  # longer words are matched by their first letters and checked afterwards
+
+# Telegram allows about 30 messages per second in total and 1 message per second to one chat
+SEND_WORKERS = 8
+SEND_RATE_GLOBAL = 30
+SEND_INTERVAL_PER_CHAT = 1
+SEND_MAX_RETRIES = 3
+
+# Bot API server url, e.g. 'http://127.0.0.1:8081/bot{0}/{1}' for local fake server. None means telegram
+BOT_API_URL = None
+
+# 'polling' - bot requests updates from telegram, 'webhook' - telegram sends updates to bot http server
+RUN_MODE = os.environ.get('RUN_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')  # public https url of this bot, e.g. 'https://bot.example.com'
+WEBHOOK_PATH = '/telegram'
+WEBHOOK_LISTEN = '0.0.0.0'
+WEBHOOK_PORT = int(os.environ.get('PORT', 8443))
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '')  # telegram sends it back in every request
+WEBHOOK_WORKERS = 8  # threads handling updates in this process, updates of one chat go to the same thread
+# number of processes handling updates in webhook mode, updates are split between them by chat id. 0 - no extra processes
+SHARD_WORKERS = int(os.environ.get('SHARD_WORKERS', 0))
+SHARD_METRICS_TIMEOUT_SECONDS = 1  # metrics of worker which did not answer in time are not shown in scrape
+
+# local http endpoint with metrics in Prometheus format, None - disabled
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
+PROFILER_ENABLED = False  # sampling profiler, could be also started by /profile/start
+PROFILER_INTERVAL_SECONDS = 0.01
 
-REMIND_WHEN_LEFT_MINUTES = 10
+# http endpoint with iCalendar feeds of course groups, None - disabled
+CALENDAR_HOST = '0.0.0.0'
+CALENDAR_PORT = None
+CALENDAR_BASE_URL = os.environ.get('CALENDAR_BASE_URL', '')  # public url of the endpoint, e.g. 'https://bot.example.com'
+CALENDAR_TIMEZONE = 'Africa/Accra'
+CALENDAR_MAX_AGE_SECONDS = 60 * 60
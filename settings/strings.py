@@ -1,10 +1,11 @@
-from settings.config import REMIND_WHEN_LEFT_MINUTES
-
 """
 All constant strings are stored in this file
 """
 
 TEXT_DAYS_OF_WEEK = ("Mo", "Tu", "We", "Th", "Fr", "Sa")
+TEXT_WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+TEXT_ALL_GROUPS = "all groups"
+TEXT_REMIND_LEAD = "{0} min ⏰"
 TEXT_BUTTON_NOW = "NOW❗"
 TEXT_BUTTON_DAY = "TODAY⌛"
 TEXT_BUTTON_WEEK = "WEEK 🗓️"
@@ -17,20 +18,23 @@ Some commands, that might be useful for you:
 /start - Start bot
 /help - Display Help
 /configure - Configure your year and course
-/reminders - Set reminders on/off"""
+/reminders - Set reminders on/off
+/calendar - Add your timetable to phone calendar"""
 
 MESSAGE_USER_NOT_CONFIGURED = "Sorry. I do not know your course yet. 😥\n" \
                               " Please use /configure command to set it up"
 MESSAGE_FREE_DAY = "No lessons on this day! You're so lucky :)"
-MESSAGE_YES = "Yes 🙋"
 MESSAGE_NO = "No 🙅"
 MESSAGE_SETTINGS_SAVED = "Your settings have been saved successfully!"
 MESSAGE_ERROR = "Sorry, I did not understand you"
 
+MESSAGE_CALENDAR = "Subscribe to this link in your calendar app and your timetable will stay up to date:\n{0}"
+MESSAGE_CALENDAR_DISABLED = "Sorry, calendar subscription is not available yet"
+
 REQUEST_COURSE = "What year are you in?"
 REQUEST_GROUP = "What's your course?"
-REQUEST_REMINDERS = f"Would you like to get reminders {REMIND_WHEN_LEFT_MINUTES} minutes " \
-    "before every lecture, tutorial and lab? 🚨"
+REQUEST_REMINDERS = "Would you like to get reminders before every lecture, tutorial and lab? 🚨\n" \
+    "Choose how many minutes before"
 REQUEST_WEEKDAY = "Select some day of the week"
 
 HEADER_NOW = "\n"
@@ -38,3 +42,10 @@ HEADER_NEXT = "\n"
 HEADER_REMIND = "⏰\n"
 HEADER_NO_NEXT_LESSONS = "                  🗽"
 HEADER_SEPARATOR = "\n"
+
+ADMIN_BROADCAST_USAGE = "Usage:\n/broadcast text - send to everyone\n" \
+                        "/broadcast Lvl 100 | Comp Eng\ntext - send to course or course group\n" \
+                        "/broadcast_resume - continue unfinished broadcasts"
+ADMIN_BROADCAST_STARTED = "Broadcast #{0} started"
+ADMIN_BROADCAST_DONE = "Broadcast #{0} finished: sent {1}, failed {2}, blocked {3}, {4} messages/s"
+ADMIN_BROADCAST_NOTHING = "No unfinished broadcasts"